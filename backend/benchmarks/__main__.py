@@ -0,0 +1,165 @@
+import argparse
+import asyncio
+import json
+import logging
+
+import uvicorn
+
+from benchmarks.fakes import create_fake_newsmatics, create_fake_openai
+from benchmarks.load import (
+    compare,
+    generate_scenario,
+    grabber_scenario,
+    load_results,
+    run_load,
+    save_results,
+    search_scenario,
+    trusted_scenario,
+)
+
+SCENARIOS = [
+    "search",
+    "search-lexical",
+    "search-hybrid",
+    "trusted",
+    "generate",
+    "grabber",
+]
+
+
+def build_scenario(name: str, args: argparse.Namespace):
+    if name.startswith("search"):
+        mode = name.partition("-")[2] or "semantic"
+        return search_scenario(mode, args.clusters)
+    if name == "trusted":
+        return trusted_scenario(args.first_id, args.articles)
+    if name == "generate":
+        return generate_scenario(args.generate_limit)
+    return grabber_scenario(args.grabber_limit)
+
+
+async def run(args: argparse.Namespace) -> dict:
+    results = {}
+    for name in args.scenario or ["search"]:
+        results[name] = await run_load(
+            args.url,
+            build_scenario(name, args),
+            requests=args.requests,
+            concurrency=args.concurrency,
+            seed=args.seed,
+        )
+        print(name, json.dumps(results[name]))
+
+    if args.recall:
+        from benchmarks.recall import measure_recall
+
+        results["recall"] = await measure_recall(
+            queries=args.recall_queries,
+            k=args.recall_k,
+            clusters=args.clusters,
+            spread=args.spread,
+        )
+        print("recall", json.dumps(results["recall"]))
+    return results
+
+
+def main() -> None:
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(prog="python -m benchmarks")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    def add_corpus_args(command: argparse.ArgumentParser) -> None:
+        command.add_argument("--clusters", type=int, default=64)
+        command.add_argument("--spread", type=float, default=0.5)
+        command.add_argument("--seed", type=int, default=0)
+
+    def add_server_args(command: argparse.ArgumentParser, port: int):
+        command.add_argument("--host", default="127.0.0.1")
+        command.add_argument("--port", type=int, default=port)
+        command.add_argument("--latency", type=float, default=0.2)
+        command.add_argument("--jitter", type=float, default=0.05)
+        add_corpus_args(command)
+
+    openai = commands.add_parser("fake-openai")
+    add_server_args(openai, 8100)
+    openai.add_argument("--embedding-latency", type=float, default=0.1)
+
+    newsmatics = commands.add_parser("fake-newsmatics")
+    add_server_args(newsmatics, 8200)
+    newsmatics.add_argument("--articles", type=int, default=100000)
+
+    corpus = commands.add_parser("load-corpus")
+    add_corpus_args(corpus)
+    corpus.add_argument("--articles", type=int, default=10000)
+    corpus.add_argument("--first-id", type=int, default=1)
+    corpus.add_argument("--chunks", type=int, default=3)
+    corpus.add_argument("--batch-size", type=int, default=1000)
+
+    load = commands.add_parser("run")
+    add_corpus_args(load)
+    load.add_argument("--url", default="http://127.0.0.1:8000/api")
+    load.add_argument(
+        "--scenario", action="append", choices=SCENARIOS
+    )
+    load.add_argument("--requests", type=int, default=500)
+    load.add_argument("--concurrency", type=int, default=16)
+    load.add_argument("--articles", type=int, default=10000)
+    load.add_argument("--first-id", type=int, default=1)
+    load.add_argument("--generate-limit", type=int, default=10)
+    load.add_argument("--grabber-limit", type=int, default=100)
+    load.add_argument("--recall", action="store_true")
+    load.add_argument("--recall-queries", type=int, default=50)
+    load.add_argument("--recall-k", type=int, default=10)
+    load.add_argument("--output")
+    load.add_argument("--baseline")
+
+    args = parser.parse_args()
+
+    if args.command == "fake-openai":
+        app = create_fake_openai(
+            latency=args.latency,
+            jitter=args.jitter,
+            embedding_latency=args.embedding_latency,
+            seed=args.seed,
+            clusters=args.clusters,
+            spread=args.spread,
+        )
+        uvicorn.run(
+            app, host=args.host, port=args.port, log_level="warning"
+        )
+    elif args.command == "fake-newsmatics":
+        app = create_fake_newsmatics(
+            latency=args.latency,
+            jitter=args.jitter,
+            articles=args.articles,
+            seed=args.seed,
+            clusters=args.clusters,
+        )
+        uvicorn.run(
+            app, host=args.host, port=args.port, log_level="warning"
+        )
+    elif args.command == "load-corpus":
+        from benchmarks.corpus import load_corpus
+
+        asyncio.run(
+            load_corpus(
+                args.articles,
+                first_id=args.first_id,
+                chunks_per_article=args.chunks,
+                clusters=args.clusters,
+                spread=args.spread,
+                seed=args.seed,
+                batch_size=args.batch_size,
+            )
+        )
+    else:
+        results = asyncio.run(run(args))
+        if args.output:
+            save_results(args.output, results)
+        if args.baseline:
+            for line in compare(results, load_results(args.baseline)):
+                print(line)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+import logging
+import time
+
+import numpy as np
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from benchmarks.synthetic import centroids, make_article, sample_vectors
+from src.articles.crud import ArticlesCRUD
+from src.articles.ingest import parse_newsmatics_article
+from src.core.lifetime import create_db_engine
+from src.embeddings.crud import EmbeddingsCRUD
+
+
+# Loads the synthetic corpus through the same CRUD paths the API and
+# the ingestion use, so triggers and staging tables are exercised too.
+async def load_corpus(
+    articles: int,
+    first_id: int = 1,
+    chunks_per_article: int = 3,
+    clusters: int = 64,
+    spread: float = 0.5,
+    seed: int = 0,
+    batch_size: int = 1000,
+) -> None:
+    engine = create_db_engine()
+    session_factory = async_sessionmaker(engine, expire_on_commit=False)
+    centers = centroids(seed, clusters) if clusters else None
+    rng = np.random.default_rng(seed)
+    start = time.perf_counter()
+
+    try:
+        for offset in range(0, articles, batch_size):
+            ids = range(
+                first_id + offset,
+                first_id + min(offset + batch_size, articles),
+            )
+            clusters_of = [id % max(clusters, 1) for id in ids]
+            batch = [
+                parse_newsmatics_article(make_article(id, cluster, rng))
+                for id, cluster in zip(ids, clusters_of)
+            ]
+            vectors = np.concatenate(
+                [
+                    sample_vectors(
+                        rng,
+                        centers,
+                        cluster,
+                        chunks_per_article,
+                        spread,
+                    )
+                    for cluster in clusters_of
+                ]
+            ).astype(np.float32)
+
+            chunk_ids = [
+                id for id in ids for _ in range(chunks_per_article)
+            ]
+            async with session_factory() as session:
+                await ArticlesCRUD(session).insert_articles(batch)
+                await EmbeddingsCRUD(
+                    session, client=None, encoding=None
+                ).insert_embeddings_batch(
+                    chunk_ids, vectors.tolist()
+                )
+                await session.commit()
+
+            logging.info(
+                "Loaded %d/%d articles in %.1fs",
+                offset + len(ids),
+                articles,
+                time.perf_counter() - start,
+            )
+    finally:
+        await engine.dispose()
@@ -0,0 +1,120 @@
+import asyncio
+import random
+import time
+
+import numpy as np
+from fastapi import FastAPI, Request
+
+from benchmarks.synthetic import centroids, make_article, text_vector
+
+
+async def _delay(latency: float, jitter: float) -> None:
+    await asyncio.sleep(max(0.0, random.gauss(latency, jitter)))
+
+
+def _tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+
+def create_fake_openai(
+    latency: float = 0.2,
+    jitter: float = 0.05,
+    embedding_latency: float = 0.1,
+    seed: int = 0,
+    clusters: int = 64,
+    spread: float = 0.5,
+) -> FastAPI:
+    app = FastAPI(title="fake-openai")
+    centers = centroids(seed, clusters) if clusters else None
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request) -> dict:
+        body = await request.json()
+        await _delay(latency, jitter)
+        messages = body.get("messages", [])
+        contents = [m.get("content") for m in messages]
+        content = next(
+            (content for content in reversed(contents) if content),
+            "benchmark query",
+        )
+        if messages and messages[-1]["role"] == "system":
+            content = f"benchmark query {random.randrange(10**6)}"
+        return {
+            "id": "chatcmpl-benchmark",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model"),
+            "choices": [
+                {
+                    "index": 0,
+                    "message": {
+                        "role": "assistant",
+                        "content": content,
+                    },
+                    "finish_reason": "stop",
+                }
+            ],
+            "usage": {
+                "prompt_tokens": _tokens(str(messages)),
+                "completion_tokens": _tokens(content),
+                "total_tokens": _tokens(str(messages) + content),
+            },
+        }
+
+    @app.post("/v1/embeddings")
+    async def embeddings(request: Request) -> dict:
+        body = await request.json()
+        inputs = body["input"]
+        if isinstance(inputs, str):
+            inputs = [inputs]
+        await _delay(embedding_latency, jitter)
+        vectors = np.stack(
+            [text_vector(text, centers, spread) for text in inputs]
+        )
+        tokens = sum(_tokens(text) for text in inputs)
+        return {
+            "object": "list",
+            "model": body.get("model"),
+            "data": [
+                {"object": "embedding", "index": i, "embedding": vector}
+                for i, vector in enumerate(vectors.tolist())
+            ],
+            "usage": {"prompt_tokens": tokens, "total_tokens": tokens},
+        }
+
+    return app
+
+
+def create_fake_newsmatics(
+    latency: float = 0.5,
+    jitter: float = 0.1,
+    articles: int = 100000,
+    first_id: int = 10**9,
+    seed: int = 0,
+    clusters: int = 64,
+) -> FastAPI:
+    app = FastAPI(title="fake-newsmatics")
+
+    @app.get("/")
+    async def list_articles(request: Request) -> dict:
+        params = request.query_params
+        size = int(params.get("page[size]", 100))
+        after = int(params.get("page[after]", 0))
+        await _delay(latency, jitter)
+
+        end = min(after + size, articles)
+        page = []
+        for index in range(after, end):
+            rng = np.random.default_rng([seed, index])
+            page.append(
+                make_article(
+                    first_id + index, index % max(clusters, 1), rng
+                )
+            )
+
+        next_url = None
+        if end < articles:
+            next_url = f"{request.base_url}?page[after]={end}"
+        return {"articles": page, "pagination": {"next": next_url}}
+
+    return app
@@ -0,0 +1,131 @@
+import asyncio
+import json
+import time
+from pathlib import Path
+from typing import Callable
+
+import httpx
+import numpy as np
+
+from benchmarks.synthetic import make_query
+
+# A scenario turns a random generator into the (method, path, params)
+# of one request against the API.
+Scenario = Callable[[np.random.Generator], tuple[str, str, dict]]
+
+
+def search_scenario(mode: str, clusters: int) -> Scenario:
+    def request(rng: np.random.Generator) -> tuple[str, str, dict]:
+        params = {"query": make_query(rng, clusters), "mode": mode}
+        return "GET", "/articles/search", params
+
+    return request
+
+
+def trusted_scenario(first_id: int, articles: int) -> Scenario:
+    def request(rng: np.random.Generator) -> tuple[str, str, dict]:
+        article_id = first_id + int(rng.integers(articles))
+        path = "/articles/trusted"
+        if rng.random() < 0.5:
+            path = "/articles/not_trusted"
+        return "POST", path, {"article_id": article_id}
+
+    return request
+
+
+def generate_scenario(limit: int) -> Scenario:
+    def request(rng: np.random.Generator) -> tuple[str, str, dict]:
+        return "GET", "/embeddings/generate", {"limit": limit}
+
+    return request
+
+
+# The grabber answers before the ingestion runs, this measures the
+# request itself, the ingestion shows up in /metrics.
+def grabber_scenario(limit: int) -> Scenario:
+    def request(rng: np.random.Generator) -> tuple[str, str, dict]:
+        return "POST", "/articles/grabber", {"limit": limit}
+
+    return request
+
+
+async def run_load(
+    base_url: str,
+    scenario: Scenario,
+    requests: int,
+    concurrency: int,
+    seed: int = 0,
+    timeout: float = 60.0,
+) -> dict:
+    rng = np.random.default_rng(seed)
+    planned = [scenario(rng) for _ in range(requests)]
+    latencies: list[float] = []
+    errors = 0
+    queue = iter(planned)
+
+    async def worker(client: httpx.AsyncClient) -> None:
+        nonlocal errors
+        for method, path, params in queue:
+            start = time.perf_counter()
+            try:
+                response = await client.request(
+                    method, path, params=params
+                )
+                response.raise_for_status()
+            except httpx.HTTPError:
+                errors += 1
+                continue
+            latencies.append(time.perf_counter() - start)
+
+    limits = httpx.Limits(max_connections=concurrency)
+    async with httpx.AsyncClient(
+        base_url=base_url, timeout=timeout, limits=limits
+    ) as client:
+        start = time.perf_counter()
+        await asyncio.gather(
+            *[worker(client) for _ in range(concurrency)]
+        )
+        duration = time.perf_counter() - start
+
+    return summarize(latencies, errors, duration)
+
+
+def summarize(
+    latencies: list[float], errors: int, duration: float
+) -> dict:
+    values = np.asarray(latencies or [float("nan")]) * 1000
+    return {
+        "requests": len(latencies) + errors,
+        "errors": errors,
+        "duration_s": round(duration, 3),
+        "throughput_rps": round(len(latencies) / duration, 2),
+        "mean_ms": round(float(np.mean(values)), 2),
+        "p50_ms": round(float(np.percentile(values, 50)), 2),
+        "p95_ms": round(float(np.percentile(values, 95)), 2),
+        "p99_ms": round(float(np.percentile(values, 99)), 2),
+    }
+
+
+def compare(results: dict, baseline: dict) -> list[str]:
+    lines = []
+    for name, result in results.items():
+        previous = baseline.get(name)
+        if not previous:
+            continue
+        for metric, value in result.items():
+            before = previous.get(metric)
+            if not isinstance(value, (int, float)) or not before:
+                continue
+            change = (value - before) / before * 100
+            lines.append(
+                f"{name} {metric}: {before} -> {value} ({change:+.1f}%)"
+            )
+    return lines
+
+
+def save_results(path: str, results: dict) -> None:
+    Path(path).write_text(json.dumps(results, indent=2) + "\n")
+
+
+def load_results(path: str) -> dict:
+    return json.loads(Path(path).read_text())
@@ -0,0 +1,79 @@
+import time
+
+import numpy as np
+from sqlalchemy import func, select, text
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from benchmarks.synthetic import centroids, sample_vectors
+from src.articles.crud import ArticlesCRUD
+from src.core.lifetime import create_db_engine
+from src.embeddings.models import EmbeddingModel
+
+
+# Compares the article ranking of the configured ANN index against an
+# exact sequential scan over the same embeddings.
+async def measure_recall(
+    queries: int = 50,
+    k: int = 10,
+    clusters: int = 64,
+    spread: float = 0.5,
+    seed: int = 1,
+) -> dict:
+    engine = create_db_engine()
+    session_factory = async_sessionmaker(engine, expire_on_commit=False)
+    centers = centroids(0, clusters) if clusters else None
+    rng = np.random.default_rng(seed)
+    recalls, ann_times, exact_times = [], [], []
+
+    try:
+        async with session_factory() as session:
+            crud = ArticlesCRUD(session)
+            for _ in range(queries):
+                cluster = int(rng.integers(max(clusters, 1)))
+                query = sample_vectors(
+                    rng, centers, cluster, 1, spread
+                )[0].tolist()
+
+                start = time.perf_counter()
+                ann = await crud.rank_semantic(
+                    query, k, similarity_threshold=-1.0
+                )
+                ann_times.append(time.perf_counter() - start)
+                await session.rollback()
+
+                start = time.perf_counter()
+                for scan in ("indexscan", "bitmapscan"):
+                    await session.execute(
+                        text(f"SET LOCAL enable_{scan} = off")
+                    )
+                res = await session.execute(
+                    select(EmbeddingModel.article_id)
+                    .group_by(EmbeddingModel.article_id)
+                    .order_by(
+                        func.min(
+                            EmbeddingModel.embedding.cosine_distance(
+                                query
+                            )
+                        )
+                    )
+                    .limit(k)
+                )
+                exact = res.scalars().all()
+                exact_times.append(time.perf_counter() - start)
+                await session.rollback()
+
+                if exact:
+                    found = len(set(ann) & set(exact))
+                    recalls.append(found / len(exact))
+    finally:
+        await engine.dispose()
+
+    return {
+        "queries": queries,
+        "k": k,
+        "recall": (
+            round(float(np.mean(recalls)), 4) if recalls else None
+        ),
+        "ann_p50_ms": round(float(np.median(ann_times)) * 1000, 2),
+        "exact_p50_ms": round(float(np.median(exact_times)) * 1000, 2),
+    }
@@ -0,0 +1,96 @@
+import zlib
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+
+DIMENSIONS = 1536
+
+TYPES = ["news", "blog", "press-release"]
+CLASSIFICATIONS = [
+    "Politics",
+    "Business",
+    "Technology",
+    "Science",
+    "Sports",
+    "Health",
+    "Entertainment",
+]
+WORDS = (
+    "market election climate energy vaccine startup league court "
+    "budget inflation satellite reactor merger tariff drought "
+    "summit protest chip battery ransomware festival transfer "
+    "museum harvest pipeline airline bank housing rail study "
+    "trial minister senate storm wildfire outbreak robot launch"
+).split()
+
+
+# Corpus vectors and fake query embeddings share the same seeded
+# centroids, so benchmark queries land close to real clusters and the
+# similarity threshold behaves like it does with OpenAI embeddings.
+def centroids(seed: int, clusters: int) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    vectors = rng.standard_normal((max(clusters, 1), DIMENSIONS))
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def sample_vectors(
+    rng: np.random.Generator,
+    centers: np.ndarray | None,
+    cluster: int,
+    count: int,
+    spread: float,
+) -> np.ndarray:
+    # spread is the norm of the noise relative to the unit centroid,
+    # two vectors of one cluster have a cosine of ~1 / (1 + spread^2).
+    noise = rng.standard_normal((count, DIMENSIONS))
+    if centers is None:
+        vectors = noise
+    else:
+        noise *= spread / np.sqrt(DIMENSIONS)
+        vectors = centers[cluster] + noise
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def text_vector(
+    text: str, centers: np.ndarray | None, spread: float
+) -> np.ndarray:
+    seed = zlib.crc32(text.encode())
+    rng = np.random.default_rng(seed)
+    cluster = seed % len(centers) if centers is not None else 0
+    return sample_vectors(rng, centers, cluster, 1, spread)[0]
+
+
+def cluster_words(cluster: int) -> list[str]:
+    return [WORDS[(cluster * 3 + i) % len(WORDS)] for i in range(3)]
+
+
+def make_article(
+    article_id: int, cluster: int, rng: np.random.Generator
+) -> dict:
+    topic = cluster_words(cluster)
+    words = rng.choice(WORDS, size=int(rng.integers(200, 800)))
+    published_at = datetime.now(timezone.utc) - timedelta(
+        minutes=int(rng.integers(0, 2 * 365 * 24 * 60))
+    )
+    return {
+        "id": article_id,
+        "title": " ".join([*topic, *rng.choice(WORDS, size=5)]),
+        "url": f"https://example.com/articles/{article_id}",
+        "type": TYPES[int(rng.integers(len(TYPES)))],
+        "classification": CLASSIFICATIONS[
+            int(rng.integers(len(CLASSIFICATIONS)))
+        ],
+        "credibility": "high",
+        "abstract": " ".join([*topic, *words[:30]]),
+        "text": " ".join([*topic, *words]),
+        "publisher": f"Publisher {article_id % 50}",
+        "publication_id": int(article_id % 50),
+        "source_id": int(article_id % 7),
+        "published_at": published_at.isoformat(),
+        "scanned_at": published_at.isoformat(),
+    }
+
+
+def make_query(rng: np.random.Generator, clusters: int) -> str:
+    topic = cluster_words(int(rng.integers(max(clusters, 1))))
+    return " ".join([*topic[:2], str(rng.choice(WORDS))])
@@ -0,0 +1,39 @@
+"""Add HNSW cosine index on embeddings
+
+Revision ID: 3c9d1e7a4b20
+Revises: 60a9fc507e0b
+Create Date: 2026-10-18 09:12:40.118204
+
+"""
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "3c9d1e7a4b20"
+down_revision = "60a9fc507e0b"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Building the graph over millions of rows takes a while, build it
+    # concurrently so ingestion and search keep running meanwhile.
+    with op.get_context().autocommit_block():
+        op.create_index(
+            "embeddings_embedding_hnsw_idx",
+            "embeddings",
+            ["embedding"],
+            postgresql_using="hnsw",
+            postgresql_with={"m": 16, "ef_construction": 64},
+            postgresql_ops={"embedding": "vector_cosine_ops"},
+            postgresql_concurrently=True,
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            "embeddings_embedding_hnsw_idx",
+            table_name="embeddings",
+            postgresql_concurrently=True,
+        )
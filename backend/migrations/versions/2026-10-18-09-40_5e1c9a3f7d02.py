@@ -0,0 +1,27 @@
+"""Update the vector extension
+
+Revision ID: 5e1c9a3f7d02
+Revises: 3c9d1e7a4b20
+Create Date: 2026-10-18 09:40:08.215733
+
+"""
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "5e1c9a3f7d02"
+down_revision = "3c9d1e7a4b20"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Databases created on the old image keep their extension version
+    # after the image moves to pgvector 0.8, iterative scans and the
+    # halfvec and bit types need the update.
+    op.execute("ALTER EXTENSION vector UPDATE")
+
+
+def downgrade() -> None:
+    # The installed library only ships the new version, keep it.
+    pass
@@ -0,0 +1,37 @@
+"""Add unlogged query_cache table
+
+Revision ID: 8f2a6c1d9e47
+Revises: 5e1c9a3f7d02
+Create Date: 2026-10-18 10:05:13.504921
+
+"""
+
+import sqlalchemy as sa
+from alembic import op
+from pgvector.sqlalchemy import Vector
+
+# revision identifiers, used by Alembic.
+revision = "8f2a6c1d9e47"
+down_revision = "5e1c9a3f7d02"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "query_cache",
+        sa.Column("key", sa.String(64), primary_key=True),
+        sa.Column("query", sa.String(), nullable=False),
+        sa.Column("embedding", Vector(dim=1536), nullable=False),
+        sa.Column(
+            "created_at",
+            sa.DateTime(timezone=True),
+            server_default=sa.func.now(),
+            nullable=False,
+        ),
+        prefixes=["UNLOGGED"],
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("query_cache")
@@ -0,0 +1,34 @@
+"""Add ingest_cursors table
+
+Revision ID: b41e07c5d8a3
+Revises: 8f2a6c1d9e47
+Create Date: 2026-10-18 11:20:02.731455
+
+"""
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "b41e07c5d8a3"
+down_revision = "8f2a6c1d9e47"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "ingest_cursors",
+        sa.Column("source", sa.String(), primary_key=True),
+        sa.Column("page_after", sa.String(), nullable=False),
+        sa.Column(
+            "updated_at",
+            sa.DateTime(timezone=True),
+            server_default=sa.func.now(),
+            nullable=False,
+        ),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("ingest_cursors")
@@ -0,0 +1,34 @@
+"""Index embeddings.article_id
+
+Revision ID: d5a83f9b16c2
+Revises: b41e07c5d8a3
+Create Date: 2026-10-18 12:02:47.902316
+
+"""
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "d5a83f9b16c2"
+down_revision = "b41e07c5d8a3"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.create_index(
+            "embeddings_article_id_idx",
+            "embeddings",
+            ["article_id"],
+            postgresql_concurrently=True,
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            "embeddings_article_id_idx",
+            table_name="embeddings",
+            postgresql_concurrently=True,
+        )
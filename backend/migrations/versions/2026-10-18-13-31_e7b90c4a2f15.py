@@ -0,0 +1,81 @@
+"""Replace the float32 HNSW index with a quantized one
+
+Revision ID: e7b90c4a2f15
+Revises: d5a83f9b16c2
+Create Date: 2026-10-18 13:31:26.045118
+
+"""
+
+from alembic import op
+from sqlalchemy import text
+
+from src.core.settings import settings
+
+# revision identifiers, used by Alembic.
+revision = "e7b90c4a2f15"
+down_revision = "d5a83f9b16c2"
+branch_labels = None
+depends_on = None
+
+QUANTIZED_INDEXES = {
+    "halfvec": (
+        "embeddings_embedding_halfvec_idx",
+        "(embedding::halfvec(1536)) halfvec_cosine_ops",
+    ),
+    "binary": (
+        "embeddings_embedding_bit_idx",
+        "(binary_quantize(embedding)::bit(1536)) bit_hamming_ops",
+    ),
+}
+
+
+def _check_vector_version() -> None:
+    # 5e1c9a3f7d02 has already updated the extension.
+    version = op.get_bind().scalar(
+        text(
+            "SELECT extversion FROM pg_extension "
+            "WHERE extname = 'vector'"
+        )
+    )
+    if tuple(int(part) for part in version.split(".")[:2]) < (0, 7):
+        raise RuntimeError(
+            f"pgvector {version} has no halfvec and binary_quantize, "
+            "rebuild the db image to install pgvector 0.7 or later."
+        )
+
+
+def upgrade() -> None:
+    # Only the index selected by DEADLOCK_VECTOR_QUANTIZATION is built
+    # and it replaces the float32 index, which is what saves memory.
+    # The full precision vectors stay in the table for the exact
+    # re-rank. Expression indexes, so no column has to be backfilled.
+    # Switching the quantization later means building the new index
+    # and dropping the old one by hand, the API refuses to start while
+    # the configured index is missing. EmbeddingModel declares the same
+    # index for the configured mode.
+    if settings.vector_quantization not in QUANTIZED_INDEXES:
+        return
+
+    _check_vector_version()
+    name, expression = QUANTIZED_INDEXES[settings.vector_quantization]
+    with op.get_context().autocommit_block():
+        op.execute(
+            f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} "
+            f"ON embeddings USING hnsw ({expression})"
+        )
+        op.execute(
+            "DROP INDEX CONCURRENTLY IF EXISTS "
+            "embeddings_embedding_hnsw_idx"
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.execute(
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS "
+            "embeddings_embedding_hnsw_idx ON embeddings "
+            "USING hnsw (embedding vector_cosine_ops) "
+            "WITH (m = 16, ef_construction = 64)"
+        )
+        for name, _ in QUANTIZED_INDEXES.values():
+            op.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
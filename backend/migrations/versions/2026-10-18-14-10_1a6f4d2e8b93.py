@@ -0,0 +1,109 @@
+"""Add indexed effective_at timestamp to articles
+
+Revision ID: 1a6f4d2e8b93
+Revises: e7b90c4a2f15
+Create Date: 2026-10-18 14:10:51.662870
+
+"""
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "1a6f4d2e8b93"
+down_revision = "e7b90c4a2f15"
+branch_labels = None
+depends_on = None
+
+BACKFILL_BATCH_SIZE = 10000
+
+
+def upgrade() -> None:
+    # A STORED generated column would rewrite the whole table under an
+    # exclusive lock, so the column is kept up to date by a trigger and
+    # existing rows are backfilled in small batches instead. The parse
+    # depends on the TimeZone and DateStyle settings, so the function
+    # is only STABLE, which is all a trigger needs.
+    op.execute(
+        """
+        CREATE FUNCTION articles_effective_at(
+            published_at text, scanned_at text
+        ) RETURNS timestamptz
+        LANGUAGE plpgsql STABLE AS $$
+        BEGIN
+            RETURN coalesce(published_at, scanned_at)::timestamptz;
+        EXCEPTION WHEN others THEN
+            RETURN NULL;
+        END
+        $$
+        """
+    )
+    op.execute(
+        """
+        CREATE FUNCTION articles_set_effective_at() RETURNS trigger
+        LANGUAGE plpgsql AS $$
+        BEGIN
+            NEW.effective_at := articles_effective_at(
+                NEW.published_at, NEW.scanned_at
+            );
+            RETURN NEW;
+        END
+        $$
+        """
+    )
+    op.add_column(
+        "articles",
+        sa.Column("effective_at", sa.DateTime(timezone=True)),
+    )
+    op.execute(
+        """
+        CREATE TRIGGER articles_effective_at
+        BEFORE INSERT OR UPDATE OF published_at, scanned_at
+        ON articles
+        FOR EACH ROW EXECUTE FUNCTION articles_set_effective_at()
+        """
+    )
+
+    with op.get_context().autocommit_block():
+        conn = op.get_bind()
+        after_id = 0
+        while True:
+            res = conn.execute(
+                sa.text(
+                    """
+                    WITH batch AS (
+                        SELECT id FROM articles
+                        WHERE id > :after_id
+                        ORDER BY id
+                        LIMIT :batch_size
+                    )
+                    UPDATE articles
+                    SET effective_at = articles_effective_at(
+                        published_at, scanned_at
+                    )
+                    FROM batch
+                    WHERE articles.id = batch.id
+                    RETURNING articles.id
+                    """
+                ),
+                {"after_id": after_id, "batch_size": BACKFILL_BATCH_SIZE},
+            )
+            ids = res.scalars().all()
+            if not ids:
+                break
+            after_id = max(ids)
+
+        op.create_index(
+            "articles_effective_at_idx",
+            "articles",
+            ["effective_at"],
+            postgresql_concurrently=True,
+        )
+
+
+def downgrade() -> None:
+    op.drop_index("articles_effective_at_idx", table_name="articles")
+    op.execute("DROP TRIGGER articles_effective_at ON articles")
+    op.drop_column("articles", "effective_at")
+    op.execute("DROP FUNCTION articles_set_effective_at()")
+    op.execute("DROP FUNCTION articles_effective_at(text, text)")
@@ -0,0 +1,94 @@
+"""Add classification_slug and filter indexes to articles
+
+Revision ID: 9c3e5b7a0d61
+Revises: 1a6f4d2e8b93
+Create Date: 2026-10-18 14:52:08.219403
+
+"""
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "9c3e5b7a0d61"
+down_revision = "1a6f4d2e8b93"
+branch_labels = None
+depends_on = None
+
+BACKFILL_BATCH_SIZE = 10000
+
+
+def upgrade() -> None:
+    # Same approach as effective_at: trigger maintained column and a
+    # batched backfill instead of a table rewriting generated column.
+    op.execute(
+        """
+        CREATE FUNCTION articles_set_classification_slug()
+        RETURNS trigger
+        LANGUAGE plpgsql AS $$
+        BEGIN
+            NEW.classification_slug := replace(
+                lower(NEW.classification), '''t ', '-'
+            );
+            RETURN NEW;
+        END
+        $$
+        """
+    )
+    op.add_column(
+        "articles",
+        sa.Column("classification_slug", sa.String()),
+    )
+    op.execute(
+        """
+        CREATE TRIGGER articles_classification_slug
+        BEFORE INSERT OR UPDATE OF classification
+        ON articles
+        FOR EACH ROW EXECUTE FUNCTION articles_set_classification_slug()
+        """
+    )
+
+    with op.get_context().autocommit_block():
+        conn = op.get_bind()
+        after_id = 0
+        while True:
+            res = conn.execute(
+                sa.text(
+                    """
+                    WITH batch AS (
+                        SELECT id FROM articles
+                        WHERE id > :after_id
+                        ORDER BY id
+                        LIMIT :batch_size
+                    )
+                    UPDATE articles
+                    SET classification_slug = replace(
+                        lower(classification), '''t ', '-'
+                    )
+                    FROM batch
+                    WHERE articles.id = batch.id
+                    RETURNING articles.id
+                    """
+                ),
+                {"after_id": after_id, "batch_size": BACKFILL_BATCH_SIZE},
+            )
+            ids = res.scalars().all()
+            if not ids:
+                break
+            after_id = max(ids)
+
+        for column in ("type", "classification_slug", "publication_id"):
+            op.create_index(
+                f"articles_{column}_idx",
+                "articles",
+                [column],
+                postgresql_concurrently=True,
+            )
+
+
+def downgrade() -> None:
+    for column in ("type", "classification_slug", "publication_id"):
+        op.drop_index(f"articles_{column}_idx", table_name="articles")
+    op.execute("DROP TRIGGER articles_classification_slug ON articles")
+    op.drop_column("articles", "classification_slug")
+    op.execute("DROP FUNCTION articles_set_classification_slug()")
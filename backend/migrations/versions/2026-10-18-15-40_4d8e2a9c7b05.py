@@ -0,0 +1,95 @@
+"""Add insertion sequence to embeddings
+
+Revision ID: 4d8e2a9c7b05
+Revises: 9c3e5b7a0d61
+Create Date: 2026-10-18 15:40:33.871052
+
+"""
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "4d8e2a9c7b05"
+down_revision = "9c3e5b7a0d61"
+branch_labels = None
+depends_on = None
+
+BACKFILL_BATCH_SIZE = 10000
+
+
+def upgrade() -> None:
+    # The default is set after adding the column, so only new rows get
+    # a value immediately and the table is not rewritten.
+    op.execute("CREATE SEQUENCE embeddings_seq_seq")
+    op.add_column("embeddings", sa.Column("seq", sa.BigInteger()))
+    op.execute(
+        "ALTER TABLE embeddings "
+        "ALTER COLUMN seq SET DEFAULT nextval('embeddings_seq_seq')"
+    )
+    op.execute(
+        "ALTER SEQUENCE embeddings_seq_seq OWNED BY embeddings.seq"
+    )
+
+    with op.get_context().autocommit_block():
+        conn = op.get_bind()
+        after_id = ""
+        while True:
+            res = conn.execute(
+                sa.text(
+                    """
+                    WITH batch AS (
+                        SELECT id FROM embeddings
+                        WHERE id > :after_id
+                        ORDER BY id
+                        LIMIT :batch_size
+                    )
+                    UPDATE embeddings
+                    SET seq = coalesce(
+                        seq, nextval('embeddings_seq_seq')
+                    )
+                    FROM batch
+                    WHERE embeddings.id = batch.id
+                    RETURNING embeddings.id
+                    """
+                ),
+                {
+                    "after_id": after_id,
+                    "batch_size": BACKFILL_BATCH_SIZE,
+                },
+            )
+            ids = res.scalars().all()
+            if not ids:
+                break
+            after_id = max(ids)
+
+        # Every row has a seq now. The validated check lets SET NOT NULL
+        # skip its own scan under the exclusive lock.
+        op.execute(
+            "ALTER TABLE embeddings "
+            "ADD CONSTRAINT embeddings_seq_not_null "
+            "CHECK (seq IS NOT NULL) NOT VALID"
+        )
+        op.execute(
+            "ALTER TABLE embeddings "
+            "VALIDATE CONSTRAINT embeddings_seq_not_null"
+        )
+        op.execute(
+            "ALTER TABLE embeddings ALTER COLUMN seq SET NOT NULL"
+        )
+        op.execute(
+            "ALTER TABLE embeddings "
+            "DROP CONSTRAINT embeddings_seq_not_null"
+        )
+
+        op.create_index(
+            "embeddings_seq_idx",
+            "embeddings",
+            ["seq"],
+            postgresql_concurrently=True,
+        )
+
+
+def downgrade() -> None:
+    op.drop_index("embeddings_seq_idx", table_name="embeddings")
+    op.drop_column("embeddings", "seq")
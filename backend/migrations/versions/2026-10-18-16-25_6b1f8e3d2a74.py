@@ -0,0 +1,120 @@
+"""Add full text search_vector to articles
+
+Revision ID: 6b1f8e3d2a74
+Revises: 4d8e2a9c7b05
+Create Date: 2026-10-18 16:25:31.502817
+
+"""
+
+import sqlalchemy as sa
+from alembic import op
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = "6b1f8e3d2a74"
+down_revision = "4d8e2a9c7b05"
+branch_labels = None
+depends_on = None
+
+BACKFILL_BATCH_SIZE = 5000
+
+
+def upgrade() -> None:
+    # Same approach as effective_at: trigger maintained column and a
+    # batched backfill instead of a table rewriting generated column.
+    # The text is capped, a tsvector can not grow past 1MB.
+    op.execute(
+        """
+        CREATE FUNCTION articles_search_vector(
+            title text, abstract text, body text
+        ) RETURNS tsvector
+        LANGUAGE sql IMMUTABLE AS $$
+            SELECT
+                setweight(
+                    to_tsvector('english', coalesce(title, '')), 'A'
+                )
+                || setweight(
+                    to_tsvector('english', coalesce(abstract, '')), 'B'
+                )
+                || setweight(
+                    to_tsvector(
+                        'english', left(coalesce(body, ''), 100000)
+                    ),
+                    'C'
+                )
+        $$
+        """
+    )
+    op.execute(
+        """
+        CREATE FUNCTION articles_set_search_vector() RETURNS trigger
+        LANGUAGE plpgsql AS $$
+        BEGIN
+            NEW.search_vector := articles_search_vector(
+                NEW.title, NEW.abstract, NEW.text
+            );
+            RETURN NEW;
+        END
+        $$
+        """
+    )
+    op.add_column(
+        "articles",
+        sa.Column("search_vector", postgresql.TSVECTOR()),
+    )
+    op.execute(
+        """
+        CREATE TRIGGER articles_search_vector
+        BEFORE INSERT OR UPDATE OF title, abstract, text
+        ON articles
+        FOR EACH ROW EXECUTE FUNCTION articles_set_search_vector()
+        """
+    )
+
+    with op.get_context().autocommit_block():
+        conn = op.get_bind()
+        after_id = 0
+        while True:
+            res = conn.execute(
+                sa.text(
+                    """
+                    WITH batch AS (
+                        SELECT id FROM articles
+                        WHERE id > :after_id
+                        ORDER BY id
+                        LIMIT :batch_size
+                    )
+                    UPDATE articles
+                    SET search_vector = articles_search_vector(
+                        title, abstract, text
+                    )
+                    FROM batch
+                    WHERE articles.id = batch.id
+                    RETURNING articles.id
+                    """
+                ),
+                {
+                    "after_id": after_id,
+                    "batch_size": BACKFILL_BATCH_SIZE,
+                },
+            )
+            ids = res.scalars().all()
+            if not ids:
+                break
+            after_id = max(ids)
+
+        op.create_index(
+            "articles_search_vector_idx",
+            "articles",
+            ["search_vector"],
+            postgresql_using="gin",
+            postgresql_concurrently=True,
+        )
+
+
+def downgrade() -> None:
+    op.drop_index("articles_search_vector_idx", table_name="articles")
+    op.execute("DROP TRIGGER articles_search_vector ON articles")
+    op.drop_column("articles", "search_vector")
+    op.execute("DROP FUNCTION articles_set_search_vector()")
+    op.execute("DROP FUNCTION articles_search_vector(text, text, text)")
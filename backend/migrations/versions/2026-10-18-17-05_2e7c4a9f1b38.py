@@ -0,0 +1,23 @@
+"""Add pg_prewarm extension
+
+Revision ID: 2e7c4a9f1b38
+Revises: 6b1f8e3d2a74
+Create Date: 2026-10-18 17:05:12.640391
+
+"""
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "2e7c4a9f1b38"
+down_revision = "6b1f8e3d2a74"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_prewarm")
+
+
+def downgrade() -> None:
+    op.execute("DROP EXTENSION IF EXISTS pg_prewarm")
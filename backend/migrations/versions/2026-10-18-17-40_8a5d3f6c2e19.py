@@ -0,0 +1,39 @@
+"""Add content_hash to embeddings
+
+Revision ID: 8a5d3f6c2e19
+Revises: 2e7c4a9f1b38
+Create Date: 2026-10-18 17:40:27.915604
+
+"""
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "8a5d3f6c2e19"
+down_revision = "2e7c4a9f1b38"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Existing rows keep a NULL hash, their chunk texts are not stored.
+    # Only chunks embedded from now on take part in the reuse.
+    op.add_column(
+        "embeddings",
+        sa.Column("content_hash", sa.String(length=64)),
+    )
+    with op.get_context().autocommit_block():
+        op.create_index(
+            "embeddings_content_hash_idx",
+            "embeddings",
+            ["content_hash"],
+            postgresql_concurrently=True,
+        )
+
+
+def downgrade() -> None:
+    op.drop_index(
+        "embeddings_content_hash_idx", table_name="embeddings"
+    )
+    op.drop_column("embeddings", "content_hash")
@@ -0,0 +1,81 @@
+"""Add unique chunk_index to embeddings
+
+Revision ID: c3e8a1d5f4b7
+Revises: 8a5d3f6c2e19
+Create Date: 2026-10-18 18:15:42.308516
+
+"""
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "c3e8a1d5f4b7"
+down_revision = "8a5d3f6c2e19"
+branch_labels = None
+depends_on = None
+
+BACKFILL_BATCH_SIZE = 5000
+
+
+def upgrade() -> None:
+    op.add_column(
+        "embeddings", sa.Column("chunk_index", sa.Integer())
+    )
+
+    # Existing chunks are numbered in insertion order, duplicates left
+    # behind by retried batches simply get the next positions.
+    with op.get_context().autocommit_block():
+        conn = op.get_bind()
+        after_id = -1
+        while True:
+            res = conn.execute(
+                sa.text(
+                    """
+                    WITH batch AS (
+                        SELECT DISTINCT article_id FROM embeddings
+                        WHERE article_id > :after_id
+                        ORDER BY article_id
+                        LIMIT :batch_size
+                    ),
+                    numbered AS (
+                        SELECT
+                            embeddings.id,
+                            row_number() OVER (
+                                PARTITION BY embeddings.article_id
+                                ORDER BY embeddings.seq, embeddings.id
+                            ) - 1 AS chunk_index
+                        FROM embeddings
+                        JOIN batch USING (article_id)
+                    )
+                    UPDATE embeddings
+                    SET chunk_index = numbered.chunk_index
+                    FROM numbered
+                    WHERE embeddings.id = numbered.id
+                    RETURNING embeddings.article_id
+                    """
+                ),
+                {
+                    "after_id": after_id,
+                    "batch_size": BACKFILL_BATCH_SIZE,
+                },
+            )
+            ids = res.scalars().all()
+            if not ids:
+                break
+            after_id = max(ids)
+
+        op.create_index(
+            "embeddings_article_id_chunk_index_idx",
+            "embeddings",
+            ["article_id", "chunk_index"],
+            unique=True,
+            postgresql_concurrently=True,
+        )
+
+
+def downgrade() -> None:
+    op.drop_index(
+        "embeddings_article_id_chunk_index_idx", table_name="embeddings"
+    )
+    op.drop_column("embeddings", "chunk_index")
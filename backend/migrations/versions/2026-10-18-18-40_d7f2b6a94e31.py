@@ -0,0 +1,38 @@
+"""Add unlogged search_results table
+
+Revision ID: d7f2b6a94e31
+Revises: c3e8a1d5f4b7
+Create Date: 2026-10-18 18:40:19.774150
+
+"""
+
+import sqlalchemy as sa
+from alembic import op
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = "d7f2b6a94e31"
+down_revision = "c3e8a1d5f4b7"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "search_results",
+        sa.Column("key", sa.String(32), primary_key=True),
+        sa.Column(
+            "article_ids",
+            postgresql.ARRAY(sa.BigInteger()),
+            nullable=False,
+        ),
+        sa.Column("complete", sa.Boolean(), nullable=False),
+        sa.Column(
+            "expires_at", sa.DateTime(timezone=True), nullable=False
+        ),
+        prefixes=["UNLOGGED"],
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("search_results")
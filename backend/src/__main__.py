@@ -1,10 +1,14 @@
 import uvicorn
 
+from src.core.metrics import clear_metrics_dir
 from src.core.settings import settings
 from src.gunicorn_runner import GunicornApplication
 
 
 def main() -> None:
+    # Snapshots left by workers of a previous run would be added to
+    # the new totals.
+    clear_metrics_dir()
     if settings.reload:
         uvicorn.run(
             "src.core.application:get_app",
@@ -1,230 +1,492 @@
-import random
-import urllib.parse
-from datetime import datetime
+import asyncio
+from datetime import datetime, timedelta
 from typing import AsyncGenerator, List
 
-import requests
-from fastapi import Depends
-from sqlalchemy import DateTime, and_, cast, func, or_, select
-from sqlalchemy.dialects.postgresql import insert
+from fastapi import Depends, Request
+from sqlalchemy import (
+    BigInteger,
+    String,
+    any_,
+    case,
+    delete,
+    func,
+    literal,
+    or_,
+    select,
+    text,
+    update,
+)
+from sqlalchemy.dialects.postgresql import ARRAY, insert
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.sql.functions import coalesce
 
-from src.articles.models import ArticleModel
+from src.articles.models import (
+    TEXT_SEARCH_CONFIG,
+    ArticleModel,
+    IngestCursorModel,
+    SearchResultModel,
+)
 from src.core.db.session import get_async_db_session
+from src.core.db.utils import (
+    copy_records,
+    estimate_count,
+    set_vector_search_params,
+)
+from src.core.metrics import timed
 from src.core.settings import settings
+from src.embeddings.engine import VectorEngine
+from src.embeddings.models import EmbeddingModel
+from src.embeddings.vectors import nearest_articles
+
+ARTICLE_COPY_COLUMNS = [
+    "id",
+    "title",
+    "url",
+    "type",
+    "classification",
+    "credibility",
+    "abstract",
+    "text",
+    "publisher",
+    "publication_id",
+    "source_id",
+    "published_at",
+    "scanned_at",
+    "trust_factor",
+]
+
+
+def reciprocal_rank_fusion(
+    *rankings: list[int], k: int = 60
+) -> list[int]:
+    scores: dict[int, float] = {}
+    for ranking in rankings:
+        for rank, article_id in enumerate(ranking, start=1):
+            score = scores.get(article_id, 0.0)
+            scores[article_id] = score + 1 / (k + rank)
+    return sorted(scores, key=scores.__getitem__, reverse=True)
 
 
 async def get_articles_crud(
+    request: Request,
     db: AsyncSession = Depends(get_async_db_session),
 ) -> AsyncGenerator["ArticlesCRUD", None]:
-    yield ArticlesCRUD(db)
+    yield ArticlesCRUD(
+        db, vector_engine=request.app.state.vector_engine
+    )
 
 
 class ArticlesCRUD:
-    def __init__(self, db: AsyncSession):
-        self.db = db
-
-    async def insert_articles(self, articles: list[ArticleModel]):
-        stmt = insert(ArticleModel).values(
-            [article.dict() for article in articles]
-        )
-        stmt = stmt.on_conflict_do_nothing(index_elements=["id"])
-        await self.db.execute(stmt)
-        await self.db.commit()
-
-    async def fetch_newsmatics_articles(
+    def __init__(
         self,
-        limit: int = 1000,
-        page_after: int | None = None,
-        init_count: int = 0,
-        added_count: int = 0,
+        db: AsyncSession,
+        vector_engine: VectorEngine | None = None,
     ):
-        if added_count >= limit:
-            print("Limit has been reached")
-            return
-
-        params = {"include-text": "1", "page[size]": 1000}
-
-        if page_after:
-            params["page[after]"] = page_after
-
-        headers = {
-            "Authorization": f"Bearer {settings.newsmatics_api_token}"
-        }
-
-        response = requests.get(
-            settings.newsmatics_api_base,
-            params=params,
-            headers=headers,
-        )
-
-        if response.status_code == 200:
-            data = response.json()
-            articles = data.get("articles", [])
-
-            if not articles:
-                print("No articles found. Stopping recursion.")
-                return
-
-            articles_data = [
-                ArticleModel(
-                    id=article.get("id"),
-                    title=article.get("title"),
-                    url=article.get("url"),
-                    type=article.get("type"),
-                    classification=article.get("classification"),
-                    credibility=article.get("credibility"),
-                    abstract=article.get("abstract"),
-                    publisher=article.get("publisher"),
-                    publication_id=article.get("publication_id"),
-                    source_id=article.get("source_id"),
-                    published_at=article.get("published_at"),
-                    scanned_at=article.get("scanned_at"),
-                    text=article.get("text"),
-                    trust_factor=random.random(),
+        self.db = db
+        self.vector_engine = vector_engine
+
+    async def insert_articles(
+        self, articles: list[ArticleModel]
+    ) -> int:
+        if not articles:
+            return 0
+
+        await self.db.execute(
+            text(
+                "CREATE TEMP TABLE IF NOT EXISTS articles_staging "
+                "(LIKE articles INCLUDING DEFAULTS) ON COMMIT DROP"
+            )
+        )
+        await copy_records(
+            self.db,
+            "articles_staging",
+            columns=ARTICLE_COPY_COLUMNS,
+            records=[
+                tuple(
+                    getattr(article, column)
+                    for column in ARTICLE_COPY_COLUMNS
                 )
                 for article in articles
-                if article.get("text") != ""
-            ]
+            ],
+        )
 
-            await self.insert_articles(articles_data)
+        columns = ", ".join(ARTICLE_COPY_COLUMNS)
+        res = await self.db.execute(
+            text(
+                "WITH staged AS "
+                "(DELETE FROM articles_staging RETURNING *) "
+                f"INSERT INTO articles ({columns}) "
+                f"SELECT {columns} FROM staged "
+                "ON CONFLICT (id) DO NOTHING RETURNING id"
+            )
+        )
+        inserted = len(res.all())
+        await self.db.commit()
+        return inserted
 
-            after = await self.get_articles_count()
+    async def get_existing_ids(self, ids: list[int]) -> set[int]:
+        res = await self.db.execute(
+            select(ArticleModel.id).where(ArticleModel.id.in_(ids))
+        )
+        return set(res.scalars().all())
 
-            next_page_after = (
-                urllib.parse.parse_qs(
-                    urllib.parse.urlparse(url).query
-                ).get("page[after]", [None])[0]
-                if (url := data.get("pagination", {}).get("next"))
-                else None
+    async def get_ingest_cursor(self, source: str) -> str | None:
+        res = await self.db.execute(
+            select(IngestCursorModel.page_after).where(
+                IngestCursorModel.source == source
             )
+        )
+        return res.scalar_one_or_none()
 
-            if next_page_after:
-                print(
-                    f"Fetching next page after ID: {next_page_after}"
-                )
-                await self.fetch_newsmatics_articles(
-                    limit=limit,
-                    page_after=next_page_after,
-                    init_count=init_count,
-                    added_count=(after - init_count) * 10000,
-                )
-            else:
-                print("No new articles found. Stopping.")
+    async def save_ingest_cursor(
+        self, source: str, page_after: str
+    ) -> None:
+        stmt = insert(IngestCursorModel).values(
+            source=source, page_after=page_after
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["source"],
+            set_={
+                "page_after": stmt.excluded.page_after,
+                "updated_at": func.now(),
+            },
+        )
+        await self.db.execute(stmt)
+
+    async def get_search_results(
+        self, key: str
+    ) -> tuple[list[int], bool] | None:
+        res = await self.db.execute(
+            select(
+                SearchResultModel.article_ids,
+                SearchResultModel.complete,
+            )
+            .where(SearchResultModel.key == key)
+            .where(SearchResultModel.expires_at > func.now())
+        )
+        row = res.one_or_none()
+        if not row:
+            return None
+        return list(row.article_ids), row.complete
+
+    async def store_search_results(
+        self, key: str, ids: list[int], complete: bool, ttl: float
+    ) -> None:
+        stmt = insert(SearchResultModel).values(
+            key=key,
+            article_ids=ids,
+            complete=complete,
+            expires_at=func.now() + timedelta(seconds=ttl),
+        )
+        # A worker that ranked fewer ids concurrently must not replace
+        # a list another worker has already grown.
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["key"],
+            set_={
+                "article_ids": stmt.excluded.article_ids,
+                "complete": stmt.excluded.complete,
+                # Growing a live list keeps its expiry, so a short
+                # lived raw ranking is not extended by later pages.
+                "expires_at": case(
+                    (
+                        SearchResultModel.expires_at > func.now(),
+                        func.least(
+                            SearchResultModel.expires_at,
+                            stmt.excluded.expires_at,
+                        ),
+                    ),
+                    else_=stmt.excluded.expires_at,
+                ),
+            },
+            where=or_(
+                SearchResultModel.expires_at <= func.now(),
+                func.cardinality(SearchResultModel.article_ids)
+                <= func.cardinality(stmt.excluded.article_ids),
+            ),
+        )
+        await self.db.execute(stmt)
 
-        else:
-            print(
-                "API request failed:",
-                response.status_code,
-                response.text,
+    async def purge_search_results(self) -> int:
+        res = await self.db.execute(
+            delete(SearchResultModel).where(
+                SearchResultModel.expires_at <= func.now()
             )
+        )
+        await self.db.commit()
+        return res.rowcount
 
-    async def get_articles(
+    def _filters(
         self,
-        article_ids: List[int],
         type: str | None = None,
         classifications: List[str] | None = None,
         pub_ids: List[int] | None = None,
         start_date: datetime | None = None,
         end_date: datetime | None = None,
-        limit: int = 100,
-    ) -> List[ArticleModel]:
-        query = select(ArticleModel)
-
+    ) -> list:
         filters = []
 
         if type:
             filters.append(ArticleModel.type == type)
 
-        if classifications or pub_ids or start_date or end_date:
+        if classifications or pub_ids:
             sub_filters = []
 
             if classifications:
                 sub_filters.append(
-                    or_(
-                        *[
-                            func.replace(
-                                func.lower(
-                                    ArticleModel.classification
-                                ),
-                                "'t ",
-                                "-",
-                            )
-                            == class_
-                            for class_ in classifications
-                        ]
-                    )
+                    ArticleModel.classification_slug
+                    == any_(literal(classifications, ARRAY(String)))
                 )
 
             if pub_ids:
                 sub_filters.append(
-                    or_(
-                        *[
-                            ArticleModel.publication_id == pub_id
-                            for pub_id in pub_ids
-                        ]
-                    )
+                    ArticleModel.publication_id
+                    == any_(literal(pub_ids, ARRAY(BigInteger)))
                 )
 
             filters.append(or_(*sub_filters))
 
         if start_date:
-            filters.append(
-                cast(
-                    coalesce(
-                        ArticleModel.published_at,
-                        ArticleModel.scanned_at,
-                    ),
-                    DateTime,
-                )
-                >= start_date
-            )
+            filters.append(ArticleModel.effective_at >= start_date)
 
         if end_date:
-            filters.append(
-                cast(
-                    coalesce(
-                        ArticleModel.published_at,
-                        ArticleModel.scanned_at,
-                    ),
-                    DateTime,
+            filters.append(ArticleModel.effective_at <= end_date)
+
+        return filters
+
+    def _nearest_articles(
+        self,
+        embedding: list[float],
+        limit: int,
+        similarity_threshold: float,
+        overfetch: int | None = None,
+        **filters,
+    ):
+        # With iterative index scans the filters are applied while
+        # walking the ANN index, which keeps scanning until enough
+        # matching rows are found.
+        return nearest_articles(
+            select(EmbeddingModel.article_id)
+            .join(
+                ArticleModel,
+                ArticleModel.id == EmbeddingModel.article_id,
+            )
+            .where(*self._filters(**filters)),
+            embedding,
+            limit=limit,
+            max_distance=1 - similarity_threshold,
+            overfetch=overfetch,
+        )
+
+    @timed("rank_semantic")
+    async def rank_semantic(
+        self,
+        embedding: list[float],
+        limit: int,
+        similarity_threshold: float,
+        **filters,
+    ) -> list[int]:
+        if self.vector_engine is not None:
+            # The scan is numpy work that releases the GIL, run it off
+            # the event loop so other requests keep being served.
+            ranked = await asyncio.to_thread(
+                self.vector_engine.nearest_articles,
+                embedding,
+                limit=limit,
+                max_distance=1 - similarity_threshold,
+                **filters,
+            )
+            return [article_id for article_id, _ in ranked]
+
+        # Articles with many close chunks can fill the over-fetched
+        # candidates, the search is repeated with a larger over-fetch
+        # until `limit` articles are found or the candidates run out.
+        # Callers rely on a short result meaning there is nothing more.
+        await set_vector_search_params(self.db)
+        overfetch = settings.search_chunk_overfetch
+        while True:
+            ranked = self._nearest_articles(
+                embedding,
+                limit,
+                similarity_threshold,
+                overfetch,
+                **filters,
+            ).subquery("ranked")
+            res = await self.db.execute(
+                select(ranked.c.article_id, ranked.c.chunks).order_by(
+                    ranked.c.distance
                 )
-                <= end_date
             )
+            rows = res.all()
+            if (
+                len(rows) >= limit
+                or not rows
+                or rows[0].chunks < limit * overfetch
+            ):
+                return [row.article_id for row in rows]
+            overfetch *= 2
+
+    @timed("rank_lexical")
+    async def rank_lexical(
+        self, query: str | None, limit: int, **filters
+    ) -> list[int]:
+        conditions = self._filters(**filters)
+        tsquery = None
+        if query and query.strip():
+            tsquery = func.websearch_to_tsquery(
+                TEXT_SEARCH_CONFIG, query
+            )
+            conditions.append(
+                ArticleModel.search_vector.bool_op("@@")(tsquery)
+            )
+
+        # Frequent terms match a large part of the table, only the most
+        # recent matches are ranked so the query stays in the
+        # millisecond range.
+        candidates = (
+            select(
+                ArticleModel.id,
+                ArticleModel.search_vector,
+                ArticleModel.effective_at,
+            )
+            .where(*conditions)
+            .order_by(ArticleModel.effective_at.desc().nulls_last())
+            .limit(settings.lexical_candidate_limit)
+            .subquery("candidates")
+        )
 
-        if filters:
-            query = query.filter(and_(*filters))
+        order_by = [candidates.c.effective_at.desc().nulls_last()]
+        if tsquery is not None:
+            # Normalization 32 scales the rank into 0..1 so title hits
+            # are not drowned out by long article bodies.
+            rank = func.ts_rank_cd(
+                candidates.c.search_vector, tsquery, 32
+            )
+            order_by.insert(0, rank.desc())
 
-        query = query.filter(ArticleModel.id.in_(article_ids))
+        res = await self.db.execute(
+            select(candidates.c.id).order_by(*order_by).limit(limit)
+        )
+        return list(res.scalars().all())
 
-        query = query.limit(limit)
+    @timed("order_by_recency")
+    async def order_by_recency(self, ids: list[int]) -> list[int]:
+        if not ids:
+            return []
+        res = await self.db.execute(
+            select(ArticleModel.id)
+            .where(
+                ArticleModel.id == any_(literal(ids, ARRAY(BigInteger)))
+            )
+            .order_by(
+                ArticleModel.effective_at.desc().nulls_last(),
+                ArticleModel.id.desc(),
+            )
+        )
+        return list(res.scalars().all())
 
-        res = await self.db.execute(query)
+    @timed("fetch_ranked")
+    async def fetch_ranked(
+        self, ids: list[int], columns: list[str] | None = None
+    ) -> list[dict]:
+        if not ids:
+            return []
 
-        return res.scalars().all()
+        columns = columns or ["id"]
+        res = await self.db.execute(
+            select(
+                ArticleModel.id.label("_id"),
+                *[getattr(ArticleModel, column) for column in columns],
+            ).where(
+                ArticleModel.id == any_(literal(ids, ARRAY(BigInteger)))
+            )
+        )
+        rows = {row["_id"]: row for row in res.mappings().all()}
+
+        # Articles deleted since they were ranked are dropped.
+        return [
+            {column: rows[article_id][column] for column in columns}
+            for article_id in ids
+            if article_id in rows
+        ]
+
+    @timed("rank_hybrid")
+    async def rank_hybrid(
+        self,
+        query: str | None,
+        embedding: list[float],
+        limit: int,
+        similarity_threshold: float,
+        **filters,
+    ) -> list[int]:
+        lexical = await self.rank_lexical(query, limit, **filters)
+        semantic = await self.rank_semantic(
+            embedding, limit, similarity_threshold, **filters
+        )
+        ids = reciprocal_rank_fusion(
+            lexical, semantic, k=settings.search_rrf_k
+        )
+        return ids[:limit]
+
+    async def get_articles_count(self, exact: bool = False) -> int:
+        if not exact:
+            estimate = await estimate_count(self.db, "articles")
+            if estimate is not None:
+                return estimate
 
-    async def get_articles_count(self) -> int:
         query = select(func.count()).select_from(ArticleModel)
         res = await self.db.execute(query)
         return res.scalar()
 
     async def set_trusted(
-        self, article_id: int, trusted: bool, multiplier: float = 0.05
-    ):
-        res = await self.db.execute(
-            select(ArticleModel).where(ArticleModel.id == article_id)
+        self,
+        article_id: int,
+        trusted: bool,
+        multiplier: float = 0.05,
+        neighbor_multiplier: float = 0.02,
+    ) -> list[tuple[int, float]]:
+        def scaled(factor: float):
+            if trusted:
+                return func.least(
+                    ArticleModel.trust_factor * (1.0 + factor), 1.0
+                )
+            return func.greatest(
+                ArticleModel.trust_factor * (1.0 - factor), 0.0
+            )
+
+        target = (
+            select(EmbeddingModel.embedding)
+            .where(EmbeddingModel.article_id == article_id)
+            .limit(1)
+            .scalar_subquery()
         )
-        article = res.scalar_one_or_none()
-        if article:
-            if not trusted:
-                article.trust_factor = max(
-                    0, article.trust_factor * (1.0 - multiplier)
+        neighbors = nearest_articles(
+            select(EmbeddingModel.article_id).where(
+                EmbeddingModel.article_id != article_id
+            ),
+            target,
+            limit=settings.trust_neighbors,
+            max_distance=1 - settings.trust_similarity_threshold,
+        ).cte("neighbors")
+
+        # One atomic statement: the new factors are computed from the
+        # locked rows, so concurrent votes cannot overwrite each other.
+        await set_vector_search_params(self.db)
+        res = await self.db.execute(
+            update(ArticleModel)
+            .where(
+                or_(
+                    ArticleModel.id == article_id,
+                    ArticleModel.id.in_(
+                        select(neighbors.c.article_id)
+                    ),
                 )
-            else:
-                article.trust_factor = min(
-                    article.trust_factor * (1.0 + multiplier), 1
+            )
+            .values(
+                trust_factor=case(
+                    (ArticleModel.id == article_id, scaled(multiplier)),
+                    else_=scaled(neighbor_multiplier),
                 )
-        await self.db.flush()
-        await self.db.refresh(article)
-        return article
+            )
+            .returning(ArticleModel.id, ArticleModel.trust_factor),
+            execution_options={"synchronize_session": False},
+        )
+        return res.all()
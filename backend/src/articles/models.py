@@ -1,25 +1,62 @@
-from sqlalchemy import BigInteger, String, Float
+from datetime import datetime
+
+from sqlalchemy import (
+    BigInteger,
+    Boolean,
+    DateTime,
+    Float,
+    Index,
+    String,
+    func,
+)
+from sqlalchemy.dialects.postgresql import ARRAY, TSVECTOR
 from sqlalchemy.orm import Mapped, mapped_column
 
 from src.core.db.declaration import CustomDeclarativeBase
 
+TEXT_SEARCH_CONFIG = "english"
+
 
 class ArticleModel(CustomDeclarativeBase):
     __tablename__ = "articles"
+    __table_args__ = (
+        Index(
+            "articles_search_vector_idx",
+            "search_vector",
+            postgresql_using="gin",
+        ),
+    )
+
     id: Mapped[int] = mapped_column(BigInteger, primary_key=True)
     title: Mapped[str] = mapped_column(String)
     url: Mapped[str] = mapped_column(String)
-    type: Mapped[str] = mapped_column(String)
+    type: Mapped[str] = mapped_column(String, index=True)
     classification: Mapped[str] = mapped_column(String)
     credibility: Mapped[str] = mapped_column(String)
     abstract: Mapped[str] = mapped_column(String)
     text: Mapped[str] = mapped_column(String)
     publisher: Mapped[str] = mapped_column(String)
-    publication_id: Mapped[int] = mapped_column(BigInteger)
+    publication_id: Mapped[int] = mapped_column(BigInteger, index=True)
     source_id: Mapped[int] = mapped_column(BigInteger)
     published_at: Mapped[str] = mapped_column(String)
     scanned_at: Mapped[str] = mapped_column(String)
     trust_factor: Mapped[float] = mapped_column(Float)
+    # Maintained by the articles_effective_at trigger from
+    # coalesce(published_at, scanned_at).
+    effective_at: Mapped[datetime | None] = mapped_column(
+        DateTime(timezone=True), index=True
+    )
+    # Maintained by the articles_classification_slug trigger, matches
+    # the slugs sent by the frontend classification filter.
+    classification_slug: Mapped[str | None] = mapped_column(
+        String, index=True
+    )
+    # Maintained by the articles_search_vector trigger from title,
+    # abstract and text weighted A, B and C. Deferred, it is only
+    # needed inside lexical search queries.
+    search_vector: Mapped[str | None] = mapped_column(
+        TSVECTOR, deferred=True
+    )
 
     def dict(self):
         return {
@@ -38,3 +75,31 @@ class ArticleModel(CustomDeclarativeBase):
             "scanned_at": self.scanned_at,
             "trust_factor": self.trust_factor
         }
+
+
+class IngestCursorModel(CustomDeclarativeBase):
+    __tablename__ = "ingest_cursors"
+
+    source: Mapped[str] = mapped_column(String, primary_key=True)
+    page_after: Mapped[str] = mapped_column(String, nullable=False)
+    updated_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True),
+        server_default=func.now(),
+        nullable=False,
+    )
+
+
+# Ranked article ids of a search, shared by all workers so any of them
+# can serve the next page. Grown on demand while complete is false.
+class SearchResultModel(CustomDeclarativeBase):
+    __tablename__ = "search_results"
+    __table_args__ = {"prefixes": ["UNLOGGED"]}
+
+    key: Mapped[str] = mapped_column(String(32), primary_key=True)
+    article_ids: Mapped[list[int]] = mapped_column(
+        ARRAY(BigInteger), nullable=False
+    )
+    complete: Mapped[bool] = mapped_column(Boolean, nullable=False)
+    expires_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), nullable=False
+    )
@@ -0,0 +1,82 @@
+import base64
+import hashlib
+import json
+from datetime import datetime
+
+from fastapi import HTTPException
+
+from src.core.settings import settings
+from src.embeddings.cache import query_cache_key
+
+
+def search_results_key(
+    mode: str,
+    query: str | None,
+    categories: list[str] | None,
+    type: str | None = None,
+    classifications: list[str] | None = None,
+    pub_ids: list[int] | None = None,
+    start_date: datetime | None = None,
+    end_date: datetime | None = None,
+    sort: str = "relevance",
+) -> str:
+    # Same query normalization as the embedding cache, so two requests
+    # sharing an embedding and filters share one ranked result set.
+    params = [
+        mode,
+        query_cache_key(query, categories),
+        type,
+        sorted(classifications or []),
+        sorted(pub_ids or []),
+        start_date.isoformat() if start_date else None,
+        end_date.isoformat() if end_date else None,
+        sort,
+    ]
+    return hashlib.sha256(json.dumps(params).encode()).hexdigest()[:32]
+
+
+def encode_cursor(key: str, after_id: int) -> str:
+    raw = f"{key}:{after_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple[str, int]:
+    try:
+        padding = "=" * (-len(cursor) % 4)
+        raw = base64.urlsafe_b64decode(cursor + padding)
+        key, after_id = raw.decode().split(":")
+        return key, int(after_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor.")
+
+
+def rows_needed(
+    ids: list[int], after_id: int | None, page_size: int
+) -> int:
+    start = 0
+    if after_id is not None:
+        try:
+            start = ids.index(after_id) + 1
+        except ValueError:
+            # Expired result set, the position is only known again once
+            # everything is ranked.
+            return settings.search_result_limit
+    # One more than the page, so it is known whether a next page exists.
+    return min(start + page_size + 1, settings.search_result_limit)
+
+
+def page_after(
+    ids: list[int], after_id: int | None, page_size: int
+) -> tuple[list[int], int | None]:
+    start = 0
+    if after_id is not None:
+        try:
+            start = ids.index(after_id) + 1
+        except ValueError:
+            # The cached result set expired and the article is not part
+            # of the recomputed one, there is no position to resume at.
+            return [], None
+
+    page = ids[start : start + page_size]
+    has_more = start + page_size < len(ids)
+    return page, page[-1] if page and has_more else None
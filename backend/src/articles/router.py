@@ -1,14 +1,44 @@
+import functools
 from datetime import datetime
+from typing import Literal
 
-from fastapi import APIRouter, Depends
+from fastapi import (
+    APIRouter,
+    BackgroundTasks,
+    Depends,
+    FastAPI,
+    HTTPException,
+    Query,
+    Request,
+)
 
 from src.articles.crud import ArticlesCRUD, get_articles_crud
-from src.articles.models import ArticleModel
-from src.articles.schema import Article, Stats
+from src.articles.ingest import NewsmaticsIngester
+from src.articles.pagination import (
+    decode_cursor,
+    encode_cursor,
+    page_after,
+    rows_needed,
+    search_results_key,
+)
+from src.articles.schema import (
+    Article,
+    Stats,
+    TrustFactor,
+    dump_articles,
+    parse_article_fields,
+)
+from src.core.cache import SingleFlight, TTLCache
+from src.core.metrics import metrics
+from src.core.responses import FastJSONResponse
+from src.core.settings import settings
 from src.embeddings.crud import EmbeddingsCRUD, get_embeddings_crud
 
 router = APIRouter(prefix="/articles", tags=["articles"])
 
+stats_cache = TTLCache(ttl=settings.stats_cache_ttl)
+search_flights = SingleFlight()
+
 
 def parse_iso_datetime(dt: str) -> datetime:
     return datetime.fromisoformat(dt.replace("Z", "+00:00"))
@@ -18,11 +48,12 @@ def parse_iso_datetime(dt: str) -> datetime:
 async def generate_random_inout(
     embeddings_crud: EmbeddingsCRUD = Depends(get_embeddings_crud),
 ):
-    return {"query": embeddings_crud.generate_random_inout()}
+    return {"query": await embeddings_crud.generate_random_inout()}
 
 
 @router.get("/search", response_model=list[Article])
 async def search_articles(
+    request: Request,
     query: str | None = None,
     cat: str | None = None,
     tp: str | None = None,
@@ -30,9 +61,14 @@ async def search_articles(
     pub_ids: str | None = None,
     start_dt: str | None = None,
     end_dt: str | None = None,
+    fields: str | None = None,
+    mode: Literal["lexical", "semantic", "hybrid"] = "semantic",
+    sort: Literal["relevance", "newest"] = "relevance",
+    cursor: str | None = None,
+    page_size: int = Query(100, ge=1, le=settings.search_result_limit),
     articles_crud: ArticlesCRUD = Depends(get_articles_crud),
-    embeddings_crud: EmbeddingsCRUD = Depends(get_embeddings_crud),
-) -> list[ArticleModel]:
+) -> FastJSONResponse:
+    columns = parse_article_fields(fields)
     classifications = cls.split(",") if cls else None
     categories = cat.split(",") if cat else None
     publication_ids = (
@@ -44,19 +80,7 @@ async def search_articles(
     if end_date:
         end_date = end_date.replace(hour=23, minute=59, second=59)
 
-    transformed_query = await embeddings_crud.sentence_transformer(
-        query=query, categories=categories
-    )
-
-    query_embedding = embeddings_crud.generate_single_embedding(
-        text=transformed_query
-    )
-    embeddings = await embeddings_crud.closest_embeddings(
-        embedding=query_embedding, limit=100
-    )
-
-    return await articles_crud.get_articles(
-        article_ids=[embedding.article_id for embedding in embeddings],
+    params = dict(
         type=tp,
         classifications=classifications,
         pub_ids=publication_ids,
@@ -64,64 +88,228 @@ async def search_articles(
         end_date=end_date,
     )
 
+    key = search_results_key(
+        mode, query, categories, sort=sort, **params
+    )
+    after_id = None
+    if cursor:
+        cursor_key, after_id = decode_cursor(cursor)
+        if cursor_key != key:
+            raise HTTPException(
+                status_code=400,
+                detail="Cursor does not match the search parameters.",
+            )
+
+    # The ranked ids are stored in the shared search_results table, so
+    # any worker serves later pages with one primary key lookup. The
+    # list is ranked only as deep as the pages requested so far and
+    # grown when a page reaches past its end.
+    ids, complete = await articles_crud.get_search_results(key) or (
+        [],
+        False,
+    )
+    needed = rows_needed(ids, after_id, page_size)
+    hit = complete or len(ids) >= needed
+    metrics.inc(
+        "deadlock_cache_requests_total",
+        cache="search_results",
+        result="hit" if hit else "miss",
+    )
+    if not hit:
+        # End the read transaction, so the connection goes back to the
+        # pool while the ranking runs on a session of its own.
+        await articles_crud.db.commit()
+        # Identical searches arriving while this one is ranked wait for
+        # its result instead of repeating the OpenAI calls and scan.
+        flight = (key, needed)
+        role = (
+            "follower" if search_flights.in_flight(flight) else "leader"
+        )
+        metrics.inc("deadlock_singleflight_total", role=role)
+        ids = await search_flights.do(
+            flight,
+            functools.partial(
+                rank_and_cache,
+                request.app,
+                key,
+                ids,
+                needed,
+                mode,
+                sort,
+                query,
+                categories,
+                params,
+            ),
+        )
+
+    page, next_after_id = page_after(ids, after_id, page_size)
+    rows = await articles_crud.fetch_ranked(page, columns)
+
+    # Rows come straight from the typed columns, so they are serialized
+    # directly instead of being validated against the response model.
+    response = FastJSONResponse(dump_articles(rows, columns))
+    if next_after_id is not None:
+        response.headers["X-Next-Cursor"] = encode_cursor(
+            key, next_after_id
+        )
+    return response
+
+
+async def rank_and_cache(
+    app: FastAPI,
+    key: str,
+    ranked: list[int],
+    needed: int,
+    mode: str,
+    sort: str,
+    query: str | None,
+    categories: list[str] | None,
+    params: dict,
+) -> list[int]:
+    # Growing by at least a factor of two keeps deep pagination at a
+    # logarithmic number of scans. Recency ordering only holds over the
+    # whole set, it is ranked to the full limit at once.
+    limit = min(
+        max(needed, 2 * len(ranked)), settings.search_result_limit
+    )
+    if sort == "newest":
+        limit = settings.search_result_limit
+
+    # Shared by every waiting request, so it runs on its own session
+    # rather than on the one of the request that happened to start it.
+    async with app.state.db_session_factory() as session:
+        articles_crud = ArticlesCRUD(
+            session, vector_engine=app.state.vector_engine
+        )
+        ids, rewritten = await rank_articles(
+            mode,
+            query,
+            categories,
+            params,
+            limit,
+            articles_crud,
+            EmbeddingsCRUD(
+                session,
+                client=app.state.openai_client,
+                encoding=app.state.encoding,
+            ),
+        )
+        complete = (
+            len(ids) < limit or limit >= settings.search_result_limit
+        )
+        if sort == "newest":
+            ids = await articles_crud.order_by_recency(ids)
+
+        # A deeper ranking can order the top differently, the pages
+        # already served keep their order and only new ids are added.
+        seen = set(ranked)
+        ids = ranked + [id for id in ids if id not in seen]
+        # Raw query results stand in for a rewrite that missed its
+        # budget, they are kept only until the rewrite is likely done.
+        ttl = settings.search_results_ttl
+        if not rewritten:
+            ttl = settings.search_results_raw_ttl
+        await articles_crud.store_search_results(
+            key, ids, complete, ttl
+        )
+        await session.commit()
+    return ids
+
+
+async def rank_articles(
+    mode: str,
+    query: str | None,
+    categories: list[str] | None,
+    params: dict,
+    limit: int,
+    articles_crud: ArticlesCRUD,
+    embeddings_crud: EmbeddingsCRUD,
+) -> tuple[list[int], bool]:
+    # The flag is False when the ids rank the raw query in place of a
+    # rewrite that missed its budget.
+    threshold = settings.search_similarity_threshold
+
+    # Lexical search runs entirely in postgres, no OpenAI round trips.
+    # Without a query the categories are matched as alternatives.
+    text_query = query
+    if not text_query and categories:
+        text_query = " or ".join(categories)
+    # Without query and categories the search is a latest news view,
+    # an index range scan over effective_at in any mode.
+    if mode == "lexical" or not text_query:
+        ids = await articles_crud.rank_lexical(
+            text_query, limit, **params
+        )
+        return ids, True
+
+    async def rank(embedding: list[float]) -> list[int]:
+        if mode == "hybrid":
+            return await articles_crud.rank_hybrid(
+                text_query, embedding, limit, threshold, **params
+            )
+        return await articles_crud.rank_semantic(
+            embedding, limit, threshold, **params
+        )
+
+    if settings.search_rewrite == "speculative":
+        return await embeddings_crud.speculative_search(
+            query, categories, rank
+        )
+
+    _, query_embedding = await embeddings_crud.embed_query(
+        query=query, categories=categories
+    )
+    return await rank(query_embedding), True
+
 
 @router.post("/grabber")
 async def article_grabber(
+    request: Request,
+    background_tasks: BackgroundTasks,
     limit: int = 10,
-    articles_crud: ArticlesCRUD = Depends(get_articles_crud),
 ):
-    init_count = await articles_crud.get_articles_count()
-    await articles_crud.fetch_newsmatics_articles(
-        limit=limit, init_count=init_count * 10000
+    ingester = NewsmaticsIngester(
+        request.app.state.db_session_factory,
+        request.app.state.http_client,
     )
+    background_tasks.add_task(ingester.run, limit=limit)
+    return {"message": f"Ingesting up to {limit} articles."}
 
 
 @router.get("/stats", response_model=Stats)
 async def get_stats(
+    exact: bool = False,
     articles_crud: ArticlesCRUD = Depends(get_articles_crud),
 ) -> Stats:
-    articles_count = await articles_crud.get_articles_count()
+    if not exact and (stats := stats_cache.get("articles")):
+        return stats
+
+    articles_count = await articles_crud.get_articles_count(exact=exact)
 
-    return Stats(count=articles_count)
+    stats = Stats(count=articles_count)
+    stats_cache.set("articles", stats)
+    return stats
 
 
-@router.post("/not_trusted")
+@router.post("/not_trusted", response_model=list[TrustFactor])
 async def not_trusted(
     article_id: int,
     articles_crud: ArticlesCRUD = Depends(get_articles_crud),
-    embeddings_crud: EmbeddingsCRUD = Depends(get_embeddings_crud),
-):
-    article = await articles_crud.set_trusted(article_id, False)
-    embedding = await embeddings_crud.get_embedding_by_article(
-        article.id
-    )
-    closest_embeddings = await embeddings_crud.closest_embeddings(
-        embedding=embedding.embedding,
-        limit=15,
-        similarity_threshold=0.9,
-    )
-    for embedding in closest_embeddings:
-        await articles_crud.set_trusted(
-            embedding.article_id, False, multiplier=0.02
-        )
+) -> list[TrustFactor]:
+    updated = await articles_crud.set_trusted(article_id, False)
+    return [
+        TrustFactor(id=id, trust_factor=trust_factor)
+        for id, trust_factor in updated
+    ]
 
 
-@router.post("/trusted")
+@router.post("/trusted", response_model=list[TrustFactor])
 async def trusted(
     article_id: int,
     articles_crud: ArticlesCRUD = Depends(get_articles_crud),
-    embeddings_crud: EmbeddingsCRUD = Depends(get_embeddings_crud),
-):
-    article = await articles_crud.set_trusted(article_id, True)
-    embedding = await embeddings_crud.get_embedding_by_article(
-        article.id
-    )
-    closest_embeddings = await embeddings_crud.closest_embeddings(
-        embedding=embedding.embedding,
-        limit=15,
-        similarity_threshold=0.9,
-    )
-    for embedding in closest_embeddings:
-        await articles_crud.set_trusted(
-            embedding.article_id, True, multiplier=0.02
-        )
+) -> list[TrustFactor]:
+    updated = await articles_crud.set_trusted(article_id, True)
+    return [
+        TrustFactor(id=id, trust_factor=trust_factor)
+        for id, trust_factor in updated
+    ]
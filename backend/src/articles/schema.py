@@ -1,4 +1,6 @@
-from src.core.schema import APIModel
+from typing import Any, Mapping
+
+from src.core.schema import APIModel, camel2snake, snake2camel
 
 class Article(APIModel):
     id: int
@@ -15,5 +17,37 @@ class Article(APIModel):
     scanned_at: str
     trust_factor: float
 
+ARTICLE_FIELDS = list(Article.model_fields)
+
+
+def parse_article_fields(fields: str | None) -> list[str]:
+    if not fields:
+        return ARTICLE_FIELDS
+    requested = {
+        camel2snake(field.strip()) for field in fields.split(",")
+    }
+    return [
+        field
+        for field in ARTICLE_FIELDS
+        if field == "id" or field in requested
+    ]
+
+
+def dump_articles(
+    rows: list[Mapping[str, Any]], fields: list[str]
+) -> list[dict[str, Any]]:
+    aliases = {
+        field: snake2camel(field, start_lower=True) for field in fields
+    }
+    return [
+        {alias: row[field] for field, alias in aliases.items()}
+        for row in rows
+    ]
+
+
 class Stats(APIModel):
     count: int
+
+class TrustFactor(APIModel):
+    id: int
+    trust_factor: float
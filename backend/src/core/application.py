@@ -7,6 +7,9 @@ from src.core.lifetime import (
     register_shutdown_event,
     register_startup_event,
 )
+from src.core.middleware import TimingMiddleware
+from src.core.router import router as core_router
+from src.core.settings import settings
 from src.embeddings.router import router as embeddings_router
 
 
@@ -27,13 +30,20 @@ def get_app() -> FastAPI:
         allow_credentials=True,
         allow_methods=["*"],
         allow_headers=["*"],
+        expose_headers=["X-Next-Cursor", "Server-Timing"],
     )
-    app.add_middleware(GZipMiddleware, minimum_size=1000)
+    app.add_middleware(
+        GZipMiddleware,
+        minimum_size=1000,
+        compresslevel=settings.gzip_compresslevel,
+    )
+    app.add_middleware(TimingMiddleware)
 
     register_startup_event(app)
     register_shutdown_event(app)
 
     app.include_router(articles_router)
     app.include_router(embeddings_router)
+    app.include_router(core_router)
 
     return app
@@ -1,3 +1,85 @@
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.core.settings import settings
+
+
+def get_vector_server_settings() -> dict[str, str]:
+    if settings.vector_index == "ivfflat":
+        return {
+            "ivfflat.probes": str(settings.ivfflat_probes),
+            "ivfflat.iterative_scan": settings.vector_iterative_scan,
+            "ivfflat.max_probes": str(settings.ivfflat_max_probes),
+        }
+    return {
+        "hnsw.ef_search": str(settings.hnsw_ef_search),
+        "hnsw.iterative_scan": settings.vector_iterative_scan,
+        "hnsw.max_scan_tuples": str(settings.hnsw_max_scan_tuples),
+    }
+
+
+async def set_vector_search_params(
+    db: AsyncSession,
+    ef_search: int | None = None,
+    probes: int | None = None,
+) -> None:
+    # Defaults are sent once per connection as server settings, only
+    # per-query overrides cost an extra statement. Behind pgbouncer
+    # there are no startup parameters, the defaults go along with
+    # every search transaction.
+    params = {}
+    if settings.db_pgbouncer:
+        params = get_vector_server_settings()
+    if settings.vector_index == "ivfflat":
+        name, value = "ivfflat.probes", probes
+    else:
+        name, value = "hnsw.ef_search", ef_search
+    if value is not None:
+        params[name] = str(value)
+
+    if not params:
+        return
+
+    binds = {}
+    calls = []
+    for i, (name, value) in enumerate(params.items()):
+        binds[f"name_{i}"] = name
+        binds[f"value_{i}"] = value
+        calls.append(f"set_config(:name_{i}, :value_{i}, true)")
+    await db.execute(text(f"SELECT {', '.join(calls)}"), binds)
+
+
+async def copy_records(
+    db: AsyncSession,
+    table: str,
+    columns: list[str],
+    records: list[tuple],
+) -> None:
+    # Binary COPY through the session's own asyncpg connection, so the
+    # rows are part of the current transaction.
+    conn = await db.connection()
+    raw_conn = await conn.get_raw_connection()
+    await raw_conn.driver_connection.copy_records_to_table(
+        table, records=records, columns=columns
+    )
+
+
+async def estimate_count(db: AsyncSession, table: str) -> int | None:
+    # Planner estimate kept fresh by autovacuum/ANALYZE, -1 until the
+    # table has been analyzed for the first time.
+    res = await db.execute(
+        text(
+            "SELECT reltuples::bigint FROM pg_class "
+            "WHERE oid = CAST(:table AS regclass)"
+        ),
+        {"table": table},
+    )
+    estimate = res.scalar()
+    if estimate is None or estimate < 0:
+        return None
+    return estimate
+
+
 def import_db_all_models() -> None:
     import pkgutil
     from pathlib import Path
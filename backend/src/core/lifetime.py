@@ -1,18 +1,66 @@
+import asyncio
 from typing import Awaitable, Callable
+from uuid import uuid4
 
+import httpx
+import tiktoken
 from fastapi import FastAPI
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+from sqlalchemy import text
 from sqlalchemy.ext.asyncio import (
+    AsyncEngine,
     async_sessionmaker,
     create_async_engine,
 )
+from sqlalchemy.pool import QueuePool
 
+from src.core.db.utils import get_vector_server_settings
+from src.core.metrics import Metrics, flush_metrics_forever, metrics
 from src.core.settings import settings
+from src.core.warmup import warm_up
+from src.embeddings.models import vector_index
 
 
-def _setup_db(app: FastAPI) -> None:
-    engine = create_async_engine(
-        str(settings.async_db_url), echo=settings.db_echo
+def create_db_engine() -> AsyncEngine:
+    # The asyncpg dialect reads prepared_statement_cache_size and
+    # prepared_statement_name_func from connect_args, they are not
+    # create_async_engine keywords.
+    connect_args = {
+        "statement_cache_size": settings.db_statement_cache_size,
+        "prepared_statement_cache_size": (
+            settings.db_statement_cache_size
+        ),
+        "server_settings": get_vector_server_settings(),
+    }
+    if settings.db_pgbouncer:
+        # In transaction mode consecutive transactions can run on
+        # different server connections, so statements must not be
+        # cached and each prepared statement gets a unique name.
+        # pgbouncer also rejects unknown startup parameters, the
+        # vector search settings are sent per transaction instead,
+        # see set_vector_search_params.
+        connect_args = {
+            "statement_cache_size": 0,
+            "prepared_statement_cache_size": 0,
+            "prepared_statement_name_func": (
+                lambda: f"__asyncpg_{uuid4()}__"
+            ),
+        }
+
+    return create_async_engine(
+        str(settings.async_db_url),
+        echo=settings.db_echo,
+        pool_size=settings.db_pool_size_per_worker,
+        max_overflow=settings.db_max_overflow,
+        pool_timeout=settings.db_pool_timeout,
+        pool_recycle=settings.db_pool_recycle,
+        pool_pre_ping=settings.db_pool_pre_ping,
+        connect_args=connect_args,
     )
+
+
+def _setup_db(app: FastAPI) -> None:
+    engine = create_db_engine()
     session_factory = async_sessionmaker(
         engine,
         expire_on_commit=False,
@@ -21,14 +69,119 @@ def _setup_db(app: FastAPI) -> None:
     app.state.db_session_factory = session_factory
 
 
+async def check_vector_index(engine: AsyncEngine) -> None:
+    # Searches order by the expression of the configured index. If it
+    # is missing, e.g. after DEADLOCK_VECTOR_QUANTIZATION changed, every
+    # search silently becomes a sequential scan.
+    async with engine.connect() as conn:
+        exists = await conn.scalar(
+            text("SELECT to_regclass(:name) IS NOT NULL"),
+            {"name": vector_index.name},
+        )
+    if not exists:
+        raise RuntimeError(
+            f"Vector index {vector_index.name} is missing, build it or "
+            "change DEADLOCK_VECTOR_QUANTIZATION to match the database."
+        )
+
+
+def create_openai_client(
+    max_retries: int | None = None,
+) -> AsyncOpenAI:
+    if max_retries is None:
+        max_retries = settings.openai_max_retries
+    return AsyncOpenAI(
+        api_key=settings.openai_token,
+        base_url=settings.openai_base_url,
+        timeout=settings.openai_timeout,
+        max_retries=max_retries,
+        http_client=DefaultAsyncHttpxClient(
+            limits=httpx.Limits(
+                max_connections=settings.openai_max_connections,
+                max_keepalive_connections=(
+                    settings.openai_max_connections
+                ),
+            ),
+        ),
+    )
+
+
+def create_encoding() -> tiktoken.Encoding:
+    return tiktoken.encoding_for_model("text-embedding-ada-002")
+
+
+def _setup_openai(app: FastAPI) -> None:
+    app.state.openai_client = create_openai_client()
+    app.state.encoding = create_encoding()
+
+
+def _setup_http(app: FastAPI) -> None:
+    app.state.http_client = httpx.AsyncClient(
+        timeout=settings.newsmatics_timeout
+    )
+
+
+def _setup_vector_engine(app: FastAPI) -> None:
+    app.state.vector_engine = None
+    app.state.vector_engine_task = None
+    if settings.vector_backend != "memory":
+        return
+
+    from src.embeddings.engine import VectorEngine
+
+    engine = VectorEngine(
+        settings.vector_engine_dir, dtype=settings.vector_engine_dtype
+    )
+    engine.reload()
+    app.state.vector_engine = engine
+    app.state.vector_engine_task = asyncio.create_task(
+        engine.refresh_forever(app.state.db_session_factory)
+    )
+
+
+def _setup_metrics(app: FastAPI) -> None:
+    from src.embeddings.crud import query_cache
+
+    def collect_pool(registry: Metrics) -> None:
+        pool = app.state.db_engine.pool
+        if not isinstance(pool, QueuePool):
+            return
+        registry.set("deadlock_db_pool_size", pool.size())
+        registry.set("deadlock_db_pool_checked_out", pool.checkedout())
+        registry.set("deadlock_db_pool_overflow", pool.overflow())
+
+    def collect_query_cache(registry: Metrics) -> None:
+        for name, value in query_cache.counters.items():
+            tier, result = name.split("_")
+            registry.set(
+                "deadlock_cache_requests_total",
+                value,
+                kind="counter",
+                cache=f"query_{tier}",
+                result="hit" if result == "hits" else "miss",
+            )
+
+    metrics.collectors = [collect_pool, collect_query_cache]
+    app.state.metrics_task = asyncio.create_task(
+        flush_metrics_forever()
+    )
+
+
 def register_startup_event(
     app: FastAPI,
 ) -> Callable[[], Awaitable[None]]:
     @app.on_event("startup")
     async def _startup() -> None:
-        app.middleware_stack = None
+        app.state.ready = False
         _setup_db(app)
-        app.middleware_stack = app.build_middleware_stack()
+        await check_vector_index(app.state.db_engine)
+        _setup_openai(app)
+        _setup_http(app)
+        _setup_vector_engine(app)
+        _setup_metrics(app)
+        # Runs in the background so the worker boots right away,
+        # /ready reports 503 until it finishes.
+        app.state.warmup_task = asyncio.create_task(warm_up(app))
 
     return _startup
 
@@ -38,6 +191,13 @@ def register_shutdown_event(
 ) -> Callable[[], Awaitable[None]]:
     @app.on_event("shutdown")
     async def _shutdown() -> None:
+        app.state.warmup_task.cancel()
+        if app.state.vector_engine_task:
+            app.state.vector_engine_task.cancel()
+        app.state.metrics_task.cancel()
+        metrics.write()
+        await app.state.http_client.aclose()
+        await app.state.openai_client.close()
         await app.state.db_engine.dispose()
 
     return _shutdown
@@ -0,0 +1,214 @@
+import asyncio
+import contextvars
+import functools
+import json
+import logging
+import os
+import shutil
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable
+
+from src.core.settings import settings
+
+LATENCY_BUCKETS = (
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+)
+
+# Stages timed during the current request, rendered into the
+# Server-Timing header by TimingMiddleware.
+request_timings: contextvars.ContextVar[list | None] = (
+    contextvars.ContextVar("request_timings", default=None)
+)
+
+
+def _key(name: str, labels: dict[str, str]) -> str:
+    return json.dumps([name, labels], sort_keys=True)
+
+
+# Process local registry. Every gunicorn worker periodically writes a
+# snapshot to its own file in metrics_dir, /metrics merges the files
+# so the numbers do not depend on which worker answers the scrape.
+class Metrics:
+    def __init__(self):
+        self.types: dict[str, str] = {}
+        self.values: dict[str, float] = {}
+        self.histograms: dict[str, list] = {}
+        self.collectors: list[Callable[["Metrics"], None]] = []
+
+    def inc(self, name: str, value: float = 1, **labels: str) -> None:
+        self.types[name] = "counter"
+        key = _key(name, labels)
+        self.values[key] = self.values.get(key, 0) + value
+
+    def set(
+        self,
+        name: str,
+        value: float,
+        kind: str = "gauge",
+        **labels: str,
+    ) -> None:
+        # kind="counter" exports a total that is tracked elsewhere.
+        self.types[name] = kind
+        self.values[_key(name, labels)] = value
+
+    def observe(self, name: str, value: float, **labels: str) -> None:
+        self.types[name] = "histogram"
+        key = _key(name, labels)
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            # Bucket counts followed by the sum and the count.
+            histogram = [0] * (len(LATENCY_BUCKETS) + 3)
+            self.histograms[key] = histogram
+        histogram[bisect_left(LATENCY_BUCKETS, value)] += 1
+        histogram[-2] += value
+        histogram[-1] += 1
+
+    def snapshot(self) -> dict:
+        for collect in self.collectors:
+            try:
+                collect(self)
+            except Exception as e:
+                logging.warning(e)
+        return {
+            "types": self.types,
+            "values": self.values,
+            "histograms": self.histograms,
+        }
+
+    def write(self) -> None:
+        path = Path(settings.metrics_dir)
+        path.mkdir(parents=True, exist_ok=True)
+        tmp = path / f".{os.getpid()}.json"
+        tmp.write_text(json.dumps(self.snapshot()))
+        os.replace(tmp, path / f"{os.getpid()}.json")
+
+
+metrics = Metrics()
+
+
+def _is_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def clear_metrics_dir() -> None:
+    shutil.rmtree(settings.metrics_dir, ignore_errors=True)
+
+
+def collect_metrics() -> dict:
+    metrics.write()
+
+    merged = {"types": {}, "values": {}, "histograms": {}}
+    for file in Path(settings.metrics_dir).glob("[0-9]*.json"):
+        try:
+            snapshot = json.loads(file.read_text())
+        except (OSError, ValueError):
+            continue
+        alive = _is_alive(int(file.stem))
+
+        merged["types"].update(snapshot["types"])
+        for key, value in snapshot["values"].items():
+            name = json.loads(key)[0]
+            # Counters of exited workers still count, their gauges
+            # describe resources that no longer exist.
+            if snapshot["types"][name] == "gauge" and not alive:
+                continue
+            merged["values"][key] = merged["values"].get(key, 0) + value
+        for key, histogram in snapshot["histograms"].items():
+            total = merged["histograms"].setdefault(
+                key, [0] * len(histogram)
+            )
+            for i, value in enumerate(histogram):
+                total[i] += value
+    return merged
+
+
+def _labels(labels: dict[str, str], **extra: str) -> str:
+    labels = {**labels, **extra}
+    if not labels:
+        return ""
+    pairs = ",".join(
+        f'{k}="{str(v).replace(chr(34), chr(39))}"'
+        for k, v in sorted(labels.items())
+    )
+    return "{" + pairs + "}"
+
+
+def render_metrics(merged: dict) -> str:
+    samples: dict[str, list[str]] = {}
+    for key, value in merged["values"].items():
+        name, labels = json.loads(key)
+        samples.setdefault(name, []).append(
+            f"{name}{_labels(labels)} {value}"
+        )
+    for key, histogram in merged["histograms"].items():
+        name, labels = json.loads(key)
+        lines = samples.setdefault(name, [])
+        cumulative = 0
+        for bound, count in zip(LATENCY_BUCKETS + ("+Inf",), histogram):
+            cumulative += count
+            lines.append(
+                f"{name}_bucket{_labels(labels, le=str(bound))} "
+                f"{cumulative}"
+            )
+        lines.append(f"{name}_sum{_labels(labels)} {histogram[-2]}")
+        lines.append(f"{name}_count{_labels(labels)} {histogram[-1]}")
+
+    output = []
+    for name in sorted(samples):
+        output.append(f"# TYPE {name} {merged['types'][name]}")
+        output.extend(samples[name])
+    return "\n".join(output) + "\n"
+
+
+@contextmanager
+def stage(name: str):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        metrics.observe("deadlock_stage_seconds", elapsed, stage=name)
+        timings = request_timings.get()
+        if timings is not None:
+            timings.append((name, elapsed))
+
+
+def timed(name: str):
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            with stage(name):
+                return await func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+async def flush_metrics_forever() -> None:
+    while True:
+        try:
+            metrics.write()
+        except OSError as e:
+            logging.warning(e)
+        await asyncio.sleep(settings.metrics_flush_seconds)
@@ -0,0 +1,60 @@
+import time
+
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from src.core.metrics import metrics, request_timings
+
+
+# Plain ASGI middleware, BaseHTTPMiddleware would run every request
+# through an extra task and memory stream.
+class TimingMiddleware:
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(
+        self, scope: Scope, receive: Receive, send: Send
+    ) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        timings: list[tuple[str, float]] = []
+        token = request_timings.set(timings)
+        start = time.perf_counter()
+        status = 500
+
+        async def send_with_timing(message: Message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                entries = [
+                    f"{name};dur={elapsed * 1000:.1f}"
+                    for name, elapsed in timings
+                ]
+                total = (time.perf_counter() - start) * 1000
+                entries.append(f"total;dur={total:.1f}")
+                headers = MutableHeaders(scope=message)
+                headers.append("Server-Timing", ", ".join(entries))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            request_timings.reset(token)
+            # Route templates keep the label set bounded, unmatched
+            # paths are grouped together.
+            route = scope.get("route")
+            endpoint = route.path if route else "unmatched"
+            metrics.observe(
+                "deadlock_request_seconds",
+                time.perf_counter() - start,
+                endpoint=endpoint,
+                method=scope["method"],
+            )
+            metrics.inc(
+                "deadlock_requests_total",
+                endpoint=endpoint,
+                method=scope["method"],
+                status=str(status),
+            )
@@ -0,0 +1,11 @@
+from typing import Any
+
+from pydantic_core import to_json
+from starlette.responses import JSONResponse
+
+
+class FastJSONResponse(JSONResponse):
+    # pydantic-core's Rust serializer, used for plain data that needs no
+    # response model validation.
+    def render(self, content: Any) -> bytes:
+        return to_json(content)
@@ -0,0 +1,26 @@
+from fastapi import APIRouter, Request
+from fastapi.responses import JSONResponse, PlainTextResponse
+
+from src.core.metrics import collect_metrics, render_metrics
+
+router = APIRouter(tags=["monitoring"])
+
+
+@router.get("/metrics", include_in_schema=False)
+async def get_metrics() -> PlainTextResponse:
+    return PlainTextResponse(
+        render_metrics(collect_metrics()),
+        media_type="text/plain; version=0.0.4",
+    )
+
+
+@router.get("/health", include_in_schema=False)
+async def health() -> dict:
+    return {"status": "ok"}
+
+
+@router.get("/ready", include_in_schema=False)
+async def ready(request: Request) -> JSONResponse:
+    if not request.app.state.ready:
+        return JSONResponse({"status": "warming up"}, status_code=503)
+    return JSONResponse({"status": "ready"})
@@ -9,12 +9,88 @@ class Settings(BaseSettings):
     workers_count: int = 3
     reload: bool = True
 
+    gzip_compresslevel: int = 5
+
     domain: str
 
     newsmatics_api_base: str
     newsmatics_api_token: str
+    newsmatics_page_size: int = 1000
+    newsmatics_timeout: float = 60.0
 
     openai_token: str
+    # Points the client at another OpenAI compatible API, e.g. the
+    # fake server of the benchmark suite.
+    openai_base_url: str | None = None
+    openai_timeout: float = 30.0
+    openai_max_retries: int = 2
+    openai_max_connections: int = 100
+
+    tokenizer_threads: int = 4
+    embedding_batch_tokens: int = 250000
+    embedding_batch_inputs: int = 2048
+    embedding_worker_concurrency: int = 4
+    embedding_worker_fetch_size: int = 500
+    embedding_worker_idle_seconds: float = 30.0
+    embedding_worker_max_attempts: int = 8
+    embedding_worker_retry_seconds: float = 300.0
+    embedding_worker_max_retry_seconds: float = 21600.0
+
+    vector_backend: str = "postgres"
+    vector_engine_dir: str = "/tmp/deadlock-vectors"
+    vector_engine_dtype: str = "float16"
+    vector_engine_refresh_seconds: float = 30.0
+    vector_engine_refresh_batch: int = 10000
+    vector_engine_seq_lag: int = 10000
+    vector_engine_reconcile_seconds: float = 3600.0
+
+    vector_index: str = "hnsw"
+    vector_quantization: str = "none"
+    vector_rerank_factor: int = 4
+    search_chunk_overfetch: int = 3
+    hnsw_ef_search: int = 100
+    ivfflat_probes: int = 10
+    vector_iterative_scan: str = "relaxed_order"
+    hnsw_max_scan_tuples: int = 20000
+    ivfflat_max_probes: int = 100
+    search_similarity_threshold: float = 0.68
+    lexical_candidate_limit: int = 5000
+    search_rrf_k: int = 60
+    # always: wait for the LLM rewrite, speculative: search the raw
+    # query meanwhile and keep it if the rewrite misses the budget,
+    # never: embed the raw query.
+    search_rewrite: str = "always"
+    search_rewrite_budget: float = 0.8
+    search_rewrite_min_chars: int = 4
+    # Serializes identical uncached query rewrites across workers with
+    # an advisory lock. The lock holds a connection during the OpenAI
+    # calls, worth it only when spikes of identical queries are common.
+    query_advisory_lock: bool = False
+    search_result_limit: int = 500
+    search_results_ttl: int = 600
+    # Raw query rankings served when the rewrite missed its budget.
+    search_results_raw_ttl: int = 30
+    trust_similarity_threshold: float = 0.9
+    trust_neighbors: int = 15
+
+    stats_cache_ttl: int = 10
+    # The backlog breakdown is a full anti-join over articles, it is
+    # only recomputed this rarely unless exact=true is requested.
+    stats_backlog_ttl: int = 3600
+
+    warmup_connections: int | None = None
+    warmup_prewarm: bool = True
+    warmup_prewarm_relations: list[str] = []
+    warmup_query: bool = True
+    warmup_timeout: float = 120.0
+
+    metrics_dir: str = "/tmp/deadlock-metrics"
+    metrics_flush_seconds: float = 5.0
+
+    query_cache_size: int = 1024
+    query_cache_ttl: int = 600
+    query_cache_shared_ttl: int = 86400
+    query_cache_purge_seconds: float = 3600.0
 
     @property
     def url(self) -> str:
@@ -27,6 +103,24 @@ class Settings(BaseSettings):
     db_base: str
     db_echo: bool
 
+    # Connections the API may open in total, split between the
+    # workers unless db_pool_size is set explicitly.
+    db_max_connections: int = 60
+    db_pool_size: int | None = None
+    db_max_overflow: int = 0
+    db_pool_timeout: float = 10.0
+    db_pool_recycle: int = 1800
+    db_pool_pre_ping: bool = False
+    db_statement_cache_size: int = 100
+    # Transaction pooling through pgbouncer, see create_db_engine.
+    db_pgbouncer: bool = False
+
+    @property
+    def db_pool_size_per_worker(self) -> int:
+        if self.db_pool_size is not None:
+            return self.db_pool_size
+        return max(1, self.db_max_connections // self.workers_count)
+
     @property
     def async_db_url(self) -> URL:
         return URL.build(
@@ -0,0 +1,88 @@
+import asyncio
+import logging
+import time
+
+from fastapi import FastAPI
+from sqlalchemy import text
+
+from src.core.settings import settings
+from src.embeddings.models import vector_index
+
+# Advisory lock key, only one worker prewarms the shared buffers.
+PREWARM_LOCK = 0x6465_6164_6C6B
+
+
+async def _open_connections(app: FastAPI) -> None:
+    # Check out the connections concurrently and release them, the pool
+    # keeps them open for the first requests.
+    count = settings.warmup_connections
+    if count is None:
+        count = settings.db_pool_size_per_worker
+
+    async def ping() -> None:
+        async with app.state.db_engine.connect() as conn:
+            await conn.execute(text("SELECT 1"))
+
+    await asyncio.gather(*[ping() for _ in range(count)])
+
+
+async def _prewarm(app: FastAPI) -> None:
+    relations = [
+        vector_index.name,
+        *settings.warmup_prewarm_relations,
+    ]
+    async with app.state.db_engine.connect() as conn:
+        locked = await conn.scalar(
+            text("SELECT pg_try_advisory_xact_lock(:key)"),
+            {"key": PREWARM_LOCK},
+        )
+        if not locked:
+            return
+        for relation in relations:
+            blocks = await conn.scalar(
+                text("SELECT pg_prewarm(:relation)"),
+                {"relation": relation},
+            )
+            logging.info("Prewarmed %s (%d blocks)", relation, blocks)
+        await conn.commit()
+
+
+async def _synthetic_query(app: FastAPI) -> None:
+    from src.articles.crud import ArticlesCRUD
+
+    # Compiles and prepares the search statements and pages in the
+    # upper layers of the index before real traffic arrives.
+    embedding = [1.0] + [0.0] * 1535
+    async with app.state.db_session_factory() as session:
+        crud = ArticlesCRUD(
+            session, vector_engine=app.state.vector_engine
+        )
+        await crud.rank_semantic(
+            embedding, 10, settings.search_similarity_threshold
+        )
+        await crud.rank_lexical("warmup", 10)
+        await session.rollback()
+
+    app.state.encoding.encode("warm up the tokenizer")
+
+
+async def warm_up(app: FastAPI) -> None:
+    start = time.perf_counter()
+    steps = [_open_connections]
+    if settings.warmup_prewarm:
+        steps.append(_prewarm)
+    if settings.warmup_query:
+        steps.append(_synthetic_query)
+
+    # Failed steps only cost first-request latency, the worker still
+    # becomes ready.
+    for step in steps:
+        try:
+            await asyncio.wait_for(step(app), settings.warmup_timeout)
+        except Exception as e:
+            logging.warning(f"Warm-up step {step.__name__} failed: {e}")
+
+    app.state.ready = True
+    logging.info(
+        "Warm-up finished in %.2fs", time.perf_counter() - start
+    )
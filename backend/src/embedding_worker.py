@@ -0,0 +1,13 @@
+import asyncio
+import logging
+
+from src.embeddings.worker import run_embedding_worker
+
+
+def main() -> None:
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(run_embedding_worker())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+import hashlib
+import time
+from array import array
+from collections import OrderedDict
+from dataclasses import dataclass
+
+
+@dataclass
+class CachedQuery:
+    query: str
+    embedding: array
+
+
+def query_cache_key(
+    query: str | None, categories: list[str] | None
+) -> str:
+    normalized_query = " ".join((query or "").lower().split())
+    normalized_categories = ",".join(
+        sorted({cat.strip().lower() for cat in categories or []})
+    )
+    return hashlib.sha256(
+        f"{normalized_query}\x1f{normalized_categories}".encode()
+    ).hexdigest()
+
+
+# In-process tier, one per gunicorn worker. The shared tier lives in the
+# unlogged query_cache table so all workers and restarts benefit.
+class QueryCache:
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries: OrderedDict[str, tuple[float, CachedQuery]] = (
+            OrderedDict()
+        )
+        self.counters = {
+            "memory_hits": 0,
+            "memory_misses": 0,
+            "shared_hits": 0,
+            "shared_misses": 0,
+        }
+
+    def get(self, key: str) -> CachedQuery | None:
+        entry = self._entries.get(key)
+        if entry is None or entry[0] < time.monotonic():
+            self._entries.pop(key, None)
+            self.counters["memory_misses"] += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self.counters["memory_hits"] += 1
+        return entry[1]
+
+    def set(self, key: str, value: CachedQuery) -> None:
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def record_shared(self, hit: bool) -> None:
+        self.counters["shared_hits" if hit else "shared_misses"] += 1
+
+    def stats(self) -> dict[str, int]:
+        return {**self.counters, "size": len(self._entries)}
@@ -1,45 +1,177 @@
-import uuid
-from typing import AsyncGenerator
+import asyncio
+import functools
+import hashlib
+import logging
+import unicodedata
+from array import array
+from datetime import datetime, timedelta, timezone
+from typing import (
+    AsyncGenerator,
+    Awaitable,
+    Callable,
+    NamedTuple,
+    TypeVar,
+)
 
 import tiktoken
 from fastapi import Depends
-from openai import OpenAI
-from sqlalchemy import func, select, text
+from openai import AsyncOpenAI
+from sqlalchemy import (
+    DateTime,
+    String,
+    any_,
+    case,
+    cast,
+    delete,
+    exists,
+    func,
+    literal,
+    select,
+    text,
+)
+from sqlalchemy.dialects.postgresql import ARRAY, insert
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import load_only
+from starlette.requests import Request
 
 from src.articles.models import ArticleModel
 from src.core.db.session import get_async_db_session
+from src.core.db.utils import copy_records, estimate_count
+from src.core.metrics import metrics, timed
 from src.core.settings import settings
-from src.embeddings.models import EmbeddingModel
+from src.embeddings.cache import (
+    CachedQuery,
+    QueryCache,
+    query_cache_key,
+)
+from src.embeddings.models import EmbeddingModel, QueryCacheModel
+
+T = TypeVar("T")
+
+EMBEDDING_MODEL = "text-embedding-ada-002"
+
+
+class Chunk(NamedTuple):
+    article_id: int
+    text: str
+    tokens: int
+    content_hash: str
+    chunk_index: int
+
+
+ChunkEmbedder = Callable[[list[Chunk]], Awaitable[list[list[float]]]]
+
+
+class EmbeddingReport(NamedTuple):
+    chunks: int
+    embedded: int
+    reused: int
+
+
+def content_hash(text: str, model: str = EMBEDDING_MODEL) -> str:
+    # Syndicated copies differ mostly in whitespace and unicode forms,
+    # the model is part of the hash so a model change re-embeds.
+    normalized = " ".join(unicodedata.normalize("NFC", text).split())
+    return hashlib.sha256(
+        f"{model}\x1f{normalized}".encode()
+    ).hexdigest()
+
+
+def record_openai_usage(operation: str, response) -> None:
+    metrics.inc("deadlock_openai_calls_total", operation=operation)
+    if response.usage:
+        metrics.inc(
+            "deadlock_openai_tokens_total",
+            response.usage.total_tokens,
+            operation=operation,
+        )
+
+
+def record_query_path(path: str) -> None:
+    metrics.inc("deadlock_query_embeddings_total", path=path)
+
+
+def _cache_late_rewrite(key: str, task: asyncio.Task) -> None:
+    if task.cancelled() or task.exception():
+        return
+    query, embedding = task.result()
+    query_cache.set(
+        key, CachedQuery(query=query, embedding=array("f", embedding))
+    )
+
+
+def number_chunks(article_ids: list[int]) -> list[int]:
+    # Position of each chunk within its article, in input order.
+    seen: dict[int, int] = {}
+    indexes = []
+    for article_id in article_ids:
+        indexes.append(seen.get(article_id, 0))
+        seen[article_id] = indexes[-1] + 1
+    return indexes
+
+
+def query_cache_cutoff() -> datetime:
+    return datetime.now(timezone.utc) - timedelta(
+        seconds=settings.query_cache_shared_ttl
+    )
+
+
+def split_by_token_budget(
+    chunks: list[Chunk],
+    max_tokens: int | None = None,
+    max_inputs: int | None = None,
+) -> list[list[Chunk]]:
+    max_tokens = max_tokens or settings.embedding_batch_tokens
+    max_inputs = max_inputs or settings.embedding_batch_inputs
+
+    batches: list[list[Chunk]] = []
+    batch: list[Chunk] = []
+    batch_tokens = 0
+    for chunk in chunks:
+        if batch and (
+            batch_tokens + chunk.tokens > max_tokens
+            or len(batch) >= max_inputs
+        ):
+            batches.append(batch)
+            batch, batch_tokens = [], 0
+        batch.append(chunk)
+        batch_tokens += chunk.tokens
+
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+query_cache = QueryCache(
+    maxsize=settings.query_cache_size, ttl=settings.query_cache_ttl
+)
 
 
 async def get_embeddings_crud(
+    request: Request,
     db: AsyncSession = Depends(get_async_db_session),
 ) -> AsyncGenerator["EmbeddingsCRUD", None]:
-    yield EmbeddingsCRUD(db)
+    yield EmbeddingsCRUD(
+        db,
+        client=request.app.state.openai_client,
+        encoding=request.app.state.encoding,
+    )
 
 
 class EmbeddingsCRUD:
-    def __init__(self, db: AsyncSession):
+    def __init__(
+        self,
+        db: AsyncSession,
+        client: AsyncOpenAI,
+        encoding: tiktoken.Encoding,
+    ):
         self.token_limit = 4000
         self.db = db
-        self.client = OpenAI(api_key=settings.openai_token)
-        self.encoding = tiktoken.encoding_for_model(
-            "text-embedding-ada-002"
-        )
+        self.client = client
+        self.encoding = encoding
 
-    async def get_embedding_by_article(
-        self, article_id: int
-    ) -> EmbeddingModel:
-        res = await self.db.execute(
-            select(EmbeddingModel).where(
-                EmbeddingModel.article_id == article_id
-            )
-        )
-        return res.scalars().first()
-
-    def generate_random_inout(self) -> str:
-        response = self.client.chat.completions.create(
+    async def generate_random_inout(self) -> str:
+        response = await self.client.chat.completions.create(
             model="gpt-4o-2024-08-06",
             messages=[
                 {
@@ -48,52 +180,26 @@ class EmbeddingsCRUD:
                 }
             ],
         )
+        record_openai_usage("chat", response)
         return response.choices[0].message.content.strip()
 
-    def generate_single_embedding(self, text: str) -> list[float]:
-        response = self.client.embeddings.create(
-            model="text-embedding-ada-002",
+    @timed("generate_single_embedding")
+    async def generate_single_embedding(
+        self, text: str
+    ) -> list[float]:
+        response = await self.client.embeddings.create(
+            model=EMBEDDING_MODEL,
             input=text,
             encoding_format="float",
         )
+        record_openai_usage("embedding", response)
         return response.data[0].embedding
 
-    async def closest_embeddings(
-        self,
-        embedding: list[float],
-        limit: int = 100,
-        similarity_threshold: float = 0.68,
-    ) -> list[EmbeddingModel]:
-        embedding_parsed = str(list(map(float, embedding)))
-
-        cosine_similarity_sql = "1 - (embedding <=> :query_embedding)"
-
-        res = await self.db.execute(
-            select(
-                EmbeddingModel,
-                text(
-                    f"{cosine_similarity_sql} AS similarity"
-                ),
-            )
-            .where(
-                text(f"{cosine_similarity_sql} >= :threshold")
-            )
-            .order_by(
-                text(f"{cosine_similarity_sql} DESC")
-            )
-            .limit(limit)
-            .params(
-                query_embedding=embedding_parsed,
-                threshold=similarity_threshold,
-            )
-        )
-
-        return res.scalars().all()
-
+    @timed("sentence_transformer")
     async def sentence_transformer(
         self, query: str | None, categories: list[str] | None
     ) -> str:
-        chat_response = self.client.chat.completions.create(
+        chat_response = await self.client.chat.completions.create(
             model="gpt-3.5-turbo-0125",
             messages=[
                 {
@@ -106,66 +212,519 @@ class EmbeddingsCRUD:
                 {"role": "user", "content": query},
             ],
         )
+        record_openai_usage("chat", chat_response)
         transformed_query = chat_response.choices[
             0
         ].message.content.strip()
         return transformed_query
 
-    async def get_unprocessed_articles(self, limit: int = 10):
+    async def cached_query(self, key: str) -> CachedQuery | None:
+        cached = query_cache.get(key)
+        if cached:
+            return cached
+
         res = await self.db.execute(
+            select(QueryCacheModel.query, QueryCacheModel.embedding)
+            .where(QueryCacheModel.key == key)
+            .where(
+                QueryCacheModel.created_at >= query_cache_cutoff()
+            )
+        )
+        row = res.one_or_none()
+        query_cache.record_shared(hit=row is not None)
+
+        if not row:
+            return None
+        cached = CachedQuery(
+            query=row.query, embedding=array("f", row.embedding)
+        )
+        query_cache.set(key, cached)
+        return cached
+
+    async def store_query(
+        self, key: str, query: str, embedding: list[float]
+    ) -> None:
+        stmt = insert(QueryCacheModel).values(
+            key=key, query=query, embedding=embedding
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["key"],
+            set_={
+                "query": stmt.excluded.query,
+                "embedding": stmt.excluded.embedding,
+                "created_at": func.now(),
+            },
+        )
+        await self.db.execute(stmt)
+
+        query_cache.set(
+            key,
+            CachedQuery(query=query, embedding=array("f", embedding)),
+        )
+
+    async def purge_query_cache(self) -> int:
+        res = await self.db.execute(
+            delete(QueryCacheModel).where(
+                QueryCacheModel.created_at < query_cache_cutoff()
+            )
+        )
+        await self.db.commit()
+        return res.rowcount
+
+    @staticmethod
+    def raw_query(
+        query: str | None, categories: list[str] | None
+    ) -> str:
+        return " ".join([query or "", *(categories or [])]).strip()
+
+    @staticmethod
+    def needs_rewrite(
+        query: str | None, categories: list[str] | None
+    ) -> bool:
+        # Empty or very short queries gain nothing from the rewrite,
+        # the categories alone are embedded as they are.
+        if settings.search_rewrite == "never":
+            return False
+        query = (query or "").strip()
+        return len(query) >= settings.search_rewrite_min_chars
+
+    async def rewrite_query(
+        self, query: str | None, categories: list[str] | None
+    ) -> tuple[str, list[float]]:
+        transformed_query = await self.sentence_transformer(
+            query=query, categories=categories
+        )
+        embedding = await self.generate_single_embedding(
+            text=transformed_query
+        )
+        return transformed_query, embedding
+
+    @timed("embed_query")
+    async def embed_query(
+        self, query: str | None, categories: list[str] | None
+    ) -> tuple[str, list[float]]:
+        key = query_cache_key(query, categories)
+
+        cached = await self.cached_query(key)
+        if cached:
+            return cached.query, list(cached.embedding)
+        return await self._embed_uncached(key, query, categories)
+
+    async def _embed_uncached(
+        self, key: str, query: str | None, categories: list[str] | None
+    ) -> tuple[str, list[float]]:
+        if settings.query_advisory_lock:
+            # Other workers computing the same query hold the lock,
+            # once it is granted their result is in the shared cache.
+            await self.db.execute(
+                text(
+                    "SELECT pg_advisory_xact_lock("
+                    "hashtextextended(:key, 0))"
+                ),
+                {"key": key},
+            )
+            cached = await self.cached_query(key)
+            if cached:
+                await self.db.commit()
+                return cached.query, list(cached.embedding)
+        else:
+            # Nothing has been written yet, end the read transaction so
+            # the connection goes back to the pool during the OpenAI
+            # calls instead of being held idle for a second or more.
+            await self.db.commit()
+
+        if self.needs_rewrite(query, categories):
+            record_query_path("rewrite")
+            transformed_query, embedding = await self.rewrite_query(
+                query, categories
+            )
+        else:
+            record_query_path("skipped")
+            transformed_query = self.raw_query(query, categories)
+            embedding = await self.generate_single_embedding(
+                text=transformed_query
+            )
+
+        await self.store_query(key, transformed_query, embedding)
+        if settings.query_advisory_lock:
+            await self.db.commit()
+        return transformed_query, embedding
+
+    @timed("speculative_search")
+    async def speculative_search(
+        self,
+        query: str | None,
+        categories: list[str] | None,
+        search: Callable[[list[float]], Awaitable[T]],
+    ) -> tuple[T, bool]:
+        # The flag is False when the raw query results are returned.
+        key = query_cache_key(query, categories)
+        if cached := await self.cached_query(key):
+            return await search(list(cached.embedding)), True
+        if not self.needs_rewrite(query, categories):
+            _, embedding = await self._embed_uncached(
+                key, query, categories
+            )
+            return await search(embedding), True
+
+        await self.db.commit()
+        deadline = (
+            asyncio.get_running_loop().time()
+            + settings.search_rewrite_budget
+        )
+
+        # The rewrite only talks to OpenAI, so it can run while the raw
+        # query is embedded and searched on this session.
+        rewrite = asyncio.create_task(
+            self.rewrite_query(query, categories)
+        )
+        try:
+            raw_embedding = await self.generate_single_embedding(
+                text=self.raw_query(query, categories)
+            )
+            raw_results = await search(raw_embedding)
+        except BaseException:
+            rewrite.cancel()
+            raise
+
+        remaining = deadline - asyncio.get_running_loop().time()
+        try:
+            transformed_query, embedding = await asyncio.wait_for(
+                asyncio.shield(rewrite), max(remaining, 0)
+            )
+        except asyncio.TimeoutError:
+            # A late rewrite lands in this worker's in-process cache
+            # only. The caller keeps the raw results briefly, so once
+            # they expire this worker serves the rewritten ones.
+            rewrite.add_done_callback(
+                functools.partial(_cache_late_rewrite, key)
+            )
+            record_query_path("raw")
+            return raw_results, False
+        except Exception as e:
+            logging.warning(f"Query rewrite failed: {e}")
+            record_query_path("raw")
+            return raw_results, False
+
+        record_query_path("rewrite")
+        await self.store_query(key, transformed_query, embedding)
+        return await search(embedding), True
+
+    async def fetch_unprocessed_articles(
+        self,
+        limit: int = 10,
+        after_id: int = 0,
+        exclude_ids: set[int] | None = None,
+    ) -> list[ArticleModel]:
+        # Anti-join backed by embeddings_article_id_idx, walked in
+        # primary key order so each batch is a short index range scan.
+        query = (
             select(ArticleModel)
+            .options(
+                load_only(
+                    ArticleModel.id,
+                    ArticleModel.title,
+                    ArticleModel.text,
+                )
+            )
             .where(
-                ArticleModel.id.notin_(
-                    select(EmbeddingModel.article_id)
+                ~exists().where(
+                    EmbeddingModel.article_id == ArticleModel.id
                 )
             )
-            .limit(limit)
-        )
-        unprocessed_articles = res.scalars().all()
-        article_ids = []
-        article_texts = []
-        for article in unprocessed_articles:
-            tokens = self.encoding.encode(article.text)
-            if article.text == "":
-                article_ids.append(article.id)
-                article_texts.append(article.title)
-            elif len(tokens) > self.token_limit:
-                for i in range(0, len(tokens), self.token_limit):
-                    article_ids.append(article.id)
-                    chunk = self.encoding.decode(
-                        tokens[i : i + self.token_limit]
+            .where(ArticleModel.id > after_id)
+        )
+        if exclude_ids:
+            query = query.where(ArticleModel.id.notin_(exclude_ids))
+
+        res = await self.db.execute(
+            query.order_by(ArticleModel.id).limit(limit)
+        )
+        return res.scalars().all()
+
+    def _chunk_articles(
+        self, articles: list[ArticleModel]
+    ) -> list[Chunk]:
+        texts = [
+            article.text or article.title or "" for article in articles
+        ]
+        encoded = self.encoding.encode_batch(
+            texts,
+            num_threads=settings.tokenizer_threads,
+            disallowed_special=(),
+        )
+
+        chunks = []
+        for article, text, tokens in zip(articles, texts, encoded):
+            if len(tokens) <= self.token_limit:
+                chunks.append(
+                    Chunk(
+                        article.id,
+                        text,
+                        len(tokens),
+                        content_hash(text),
+                        0,
                     )
-                    article_texts.append(chunk)
-            else:
-                article_ids.append(article.id)
-                article_texts.append(article.text)
-        return article_ids, article_texts
+                )
+                continue
+
+            windows = [
+                tokens[i : i + self.token_limit]
+                for i in range(0, len(tokens), self.token_limit)
+            ]
+            decoded = self.encoding.decode_batch(
+                windows, num_threads=settings.tokenizer_threads
+            )
+            chunks.extend(
+                Chunk(
+                    article.id,
+                    chunk_text,
+                    len(window),
+                    content_hash(chunk_text),
+                    chunk_index,
+                )
+                for chunk_index, (window, chunk_text) in enumerate(
+                    zip(windows, decoded)
+                )
+            )
+        return chunks
+
+    async def chunk_articles(
+        self, articles: list[ArticleModel]
+    ) -> list[Chunk]:
+        # tiktoken releases the GIL, so batched encoding runs on its own
+        # thread pool without blocking the event loop.
+        return await asyncio.to_thread(self._chunk_articles, articles)
+
+    async def get_unprocessed_articles(
+        self, limit: int = 10
+    ) -> list[Chunk]:
+        articles = await self.fetch_unprocessed_articles(limit=limit)
+        return await self.chunk_articles(articles)
 
-    def generate_embeddings_batch(
+    @timed("generate_embeddings_batch")
+    async def generate_embeddings_batch(
         self, data: list[str]
     ) -> list[list[float]]:
-        response = self.client.embeddings.create(
-            model="text-embedding-ada-002",
+        response = await self.client.embeddings.create(
+            model=EMBEDDING_MODEL,
             input=data,
             encoding_format="float",
         )
+        record_openai_usage("embedding", response)
         return [item.embedding for item in response.data]
 
     async def insert_embeddings_batch(
-        self, article_ids: list[int], embeddings: list[list[float]]
+        self,
+        article_ids: list[int],
+        embeddings: list[list[float]],
+        content_hashes: list[str] | None = None,
+        chunk_indexes: list[int] | None = None,
+    ) -> None:
+        if not article_ids:
+            return
+
+        # Vectors are copied as real[] which asyncpg encodes natively,
+        # and cast to vector while merging into the real table.
+        # (article_id, chunk_index) is unique, a retried batch skips
+        # the chunks stored by the first attempt.
+        await self.db.execute(
+            text(
+                "CREATE TEMP TABLE IF NOT EXISTS embeddings_staging "
+                "(article_id bigint NOT NULL, "
+                "chunk_index integer NOT NULL, "
+                "embedding real[] NOT NULL, "
+                "content_hash varchar(64)) ON COMMIT DROP"
+            )
+        )
+        await copy_records(
+            self.db,
+            "embeddings_staging",
+            columns=[
+                "article_id",
+                "chunk_index",
+                "embedding",
+                "content_hash",
+            ],
+            records=list(
+                zip(
+                    article_ids,
+                    chunk_indexes or number_chunks(article_ids),
+                    embeddings,
+                    content_hashes or [None] * len(article_ids),
+                )
+            ),
+        )
+        await self.db.execute(
+            text(
+                "WITH staged AS "
+                "(DELETE FROM embeddings_staging RETURNING *) "
+                "INSERT INTO embeddings (id, article_id, chunk_index, "
+                "embedding, content_hash) "
+                "SELECT gen_random_uuid()::text, article_id, "
+                "chunk_index, embedding::vector, content_hash "
+                "FROM staged "
+                "ON CONFLICT (article_id, chunk_index) DO NOTHING"
+            )
+        )
+        await self.db.commit()
+
+    async def existing_content_hashes(
+        self, content_hashes: set[str]
+    ) -> set[str]:
+        if not content_hashes:
+            return set()
+        res = await self.db.execute(
+            select(EmbeddingModel.content_hash)
+            .where(
+                EmbeddingModel.content_hash
+                == any_(literal(list(content_hashes), ARRAY(String)))
+            )
+            .distinct()
+        )
+        return set(res.scalars().all())
+
+    async def insert_reused_embeddings(
+        self, chunks: list[Chunk]
     ) -> None:
-        embedding_models = [
-            EmbeddingModel(
-                id=str(uuid.uuid4()),
-                article_id=article_id,
-                embedding=embedding,
+        if not chunks:
+            return
+
+        # The stored vectors are copied inside postgres, they never
+        # travel to the application.
+        await self.db.execute(
+            text(
+                "CREATE TEMP TABLE IF NOT EXISTS "
+                "embeddings_reuse_staging (article_id bigint NOT NULL, "
+                "chunk_index integer NOT NULL, "
+                "content_hash varchar(64) NOT NULL) ON COMMIT DROP"
             )
-            for article_id, embedding in zip(article_ids, embeddings)
+        )
+        await copy_records(
+            self.db,
+            "embeddings_reuse_staging",
+            columns=["article_id", "chunk_index", "content_hash"],
+            records=[
+                (
+                    chunk.article_id,
+                    chunk.chunk_index,
+                    chunk.content_hash,
+                )
+                for chunk in chunks
+            ],
+        )
+        await self.db.execute(
+            text(
+                "WITH staged AS "
+                "(DELETE FROM embeddings_reuse_staging RETURNING *) "
+                "INSERT INTO embeddings (id, article_id, chunk_index, "
+                "embedding, content_hash) "
+                "SELECT gen_random_uuid()::text, staged.article_id, "
+                "staged.chunk_index, source.embedding, "
+                "staged.content_hash FROM staged "
+                "CROSS JOIN LATERAL (SELECT embedding FROM embeddings "
+                "WHERE content_hash = staged.content_hash "
+                "LIMIT 1) source "
+                "ON CONFLICT (article_id, chunk_index) DO NOTHING"
+            )
+        )
+
+    async def _embed_chunk_texts(
+        self, chunks: list[Chunk]
+    ) -> list[list[float]]:
+        return await self.generate_embeddings_batch(
+            data=[chunk.text for chunk in chunks]
+        )
+
+    async def embed_chunks(
+        self, chunks: list[Chunk], embed: ChunkEmbedder | None = None
+    ) -> EmbeddingReport:
+        embed = embed or self._embed_chunk_texts
+        known = await self.existing_content_hashes(
+            {chunk.content_hash for chunk in chunks}
+        )
+
+        # One API input per distinct text, copies within the batch and
+        # texts embedded before share the vector.
+        pending: dict[str, Chunk] = {}
+        for chunk in chunks:
+            if chunk.content_hash not in known:
+                pending.setdefault(chunk.content_hash, chunk)
+
+        vectors: dict[str, list[float]] = {}
+        for batch in split_by_token_budget(list(pending.values())):
+            for chunk, vector in zip(batch, await embed(batch)):
+                vectors[chunk.content_hash] = vector
+
+        await self.insert_reused_embeddings(
+            [chunk for chunk in chunks if chunk.content_hash in known]
+        )
+        embedded = [
+            chunk for chunk in chunks if chunk.content_hash in vectors
         ]
-        self.db.add_all(embedding_models)
+        await self.insert_embeddings_batch(
+            [chunk.article_id for chunk in embedded],
+            [vectors[chunk.content_hash] for chunk in embedded],
+            [chunk.content_hash for chunk in embedded],
+            [chunk.chunk_index for chunk in embedded],
+        )
         await self.db.commit()
 
-    async def get_embeddings_count(self) -> int:
+        report = EmbeddingReport(
+            chunks=len(chunks),
+            embedded=len(pending),
+            reused=len(chunks) - len(pending),
+        )
+        metrics.inc(
+            "deadlock_embedding_chunks_total",
+            report.embedded,
+            source="api",
+        )
+        metrics.inc(
+            "deadlock_embedding_chunks_total",
+            report.reused,
+            source="reused",
+        )
+        return report
+
+    async def get_embeddings_count(self, exact: bool = False) -> int:
+        if not exact:
+            estimate = await estimate_count(self.db, "embeddings")
+            if estimate is not None:
+                return estimate
+
         query = select(func.count()).select_from(EmbeddingModel)
         res = await self.db.execute(query)
         return res.scalar()
+
+    async def get_backlog_by_age(self) -> dict[str, int]:
+        # scanned_at is free text from the feed, values that do not
+        # parse as a timestamp count as older instead of failing.
+        scanned_at = case(
+            (
+                func.pg_input_is_valid(
+                    ArticleModel.scanned_at, "timestamptz"
+                ),
+                cast(ArticleModel.scanned_at, DateTime(timezone=True)),
+            ),
+        )
+        age = func.now() - scanned_at
+        bucket = case(
+            (age < timedelta(hours=1), "1h"),
+            (age < timedelta(days=1), "24h"),
+            (age < timedelta(days=7), "7d"),
+            else_="older",
+        ).label("age")
+
+        res = await self.db.execute(
+            select(bucket, func.count())
+            .where(
+                ~exists().where(
+                    EmbeddingModel.article_id == ArticleModel.id
+                )
+            )
+            .group_by(text("age"))
+        )
+        backlog = {"1h": 0, "24h": 0, "7d": 0, "older": 0}
+        backlog.update(dict(res.all()))
+        return backlog
@@ -0,0 +1,419 @@
+import asyncio
+import fcntl
+import json
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+import numpy as np
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from src.articles.models import ArticleModel
+from src.core.settings import settings
+from src.embeddings.models import EmbeddingModel
+from src.embeddings.vectors import DIMENSIONS
+
+META_DTYPE = np.dtype(
+    [
+        ("seq", "<i8"),
+        ("article_id", "<i8"),
+        ("publication_id", "<i8"),
+        ("effective_at", "<i8"),
+        ("type", "<i4"),
+        ("classification", "<i4"),
+    ]
+)
+NULL_TIME = np.iinfo(np.int64).min
+# Float16 blocks are converted into a reused float32 buffer of this many
+# rows, 24MB per search thread.
+BLOCK_ROWS = 4096
+
+
+def _timestamp(value: datetime) -> int:
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return int(value.timestamp())
+
+
+# Keeps every embedding in an append-only matrix file that is memory
+# mapped by all gunicorn workers, so the OS page cache holds a single
+# copy. One worker at a time (guarded by flock) appends new rows from
+# the embeddings table; the others remap when state.json changes.
+class VectorEngine:
+    def __init__(self, path: str, dtype: str):
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.state = {
+            "rows": 0,
+            "last_seq": 0,
+            # Rows before window_row all have a seq at or below
+            # last_seq - vector_engine_seq_lag, so the re-read window
+            # of a refresh only has to be matched against later rows.
+            "window_row": 0,
+            "deleted": 0,
+            "reconciled_at": 0.0,
+            "dtype": dtype,
+            "types": {},
+            "classifications": {},
+        }
+        self.vectors: np.ndarray | None = None
+        self.meta: np.ndarray | None = None
+        self.deleted: np.ndarray | None = None
+        self._state_mtime: int | None = None
+        self._buffers = threading.local()
+
+    @property
+    def _state_file(self) -> Path:
+        return self.path / "state.json"
+
+    @property
+    def _vectors_file(self) -> Path:
+        return self.path / "vectors.bin"
+
+    @property
+    def _meta_file(self) -> Path:
+        return self.path / "meta.bin"
+
+    @property
+    def _deleted_file(self) -> Path:
+        return self.path / "deleted.npy"
+
+    def reload(self) -> None:
+        try:
+            mtime = self._state_file.stat().st_mtime_ns
+        except FileNotFoundError:
+            return
+        if mtime == self._state_mtime:
+            return
+
+        state = json.loads(self._state_file.read_text())
+        rows = state["rows"]
+        if rows:
+            self.vectors = np.memmap(
+                self._vectors_file,
+                dtype=np.dtype(state["dtype"]),
+                mode="r",
+                shape=(rows, DIMENSIONS),
+            )
+            self.meta = np.memmap(
+                self._meta_file,
+                dtype=META_DTYPE,
+                mode="r",
+                shape=(rows,),
+            )
+        self.deleted = None
+        if state.get("deleted"):
+            self.deleted = np.load(self._deleted_file)
+        self.state = state
+        self._state_mtime = mtime
+
+    def _write_state(self) -> None:
+        tmp_file = self._state_file.with_suffix(".tmp")
+        tmp_file.write_text(json.dumps(self.state))
+        os.replace(tmp_file, self._state_file)
+
+    async def refresh(
+        self, session_factory: async_sessionmaker[AsyncSession]
+    ) -> None:
+        with open(self.path / "refresh.lock", "w") as lock:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                # Another worker is appending, just pick up its result.
+                self.reload()
+                return
+
+            self.reload()
+            # Sequence values are assigned before commit, so rows can
+            # become visible out of order. Re-read a window below the
+            # last loaded seq and skip the rows that are already loaded.
+            lag = settings.vector_engine_seq_lag
+            after_seq = max(0, self.state["last_seq"] - lag)
+            loaded = await asyncio.to_thread(
+                self._loaded_seqs, after_seq
+            )
+            while True:
+                async with session_factory() as session:
+                    rows = await self._fetch(session, after_seq)
+                if not rows:
+                    break
+                after_seq = rows[-1].seq
+                rows = [row for row in rows if row.seq not in loaded]
+                if rows:
+                    await asyncio.to_thread(self._append, rows)
+
+            elapsed = time.time() - self.state.get("reconciled_at", 0)
+            if elapsed >= settings.vector_engine_reconcile_seconds:
+                self.reload()
+                await self._reconcile(session_factory)
+
+        self.reload()
+
+    async def refresh_forever(
+        self, session_factory: async_sessionmaker[AsyncSession]
+    ) -> None:
+        while True:
+            try:
+                await self.refresh(session_factory)
+            except Exception as e:
+                logging.warning(e)
+            await asyncio.sleep(settings.vector_engine_refresh_seconds)
+
+    def _loaded_seqs(self, after_seq: int) -> set[int]:
+        if self.meta is None:
+            return set()
+        seqs = self.meta["seq"][self.state.get("window_row", 0) :]
+        return set(seqs[seqs > after_seq].tolist())
+
+    async def _reconcile(
+        self, session_factory: async_sessionmaker[AsyncSession]
+    ) -> None:
+        # The files are append-only, rows deleted from the embeddings
+        # table are masked out of the search instead of being removed.
+        # Rebuild the directory to reclaim their space.
+        seqs = []
+        async with session_factory() as session:
+            result = await session.stream_scalars(
+                select(EmbeddingModel.seq).where(
+                    EmbeddingModel.seq <= self.state["last_seq"]
+                )
+            )
+            async for partition in result.partitions(100000):
+                seqs.append(np.array(partition, dtype=np.int64))
+
+        def find_deleted() -> np.ndarray:
+            if self.meta is None:
+                return np.empty(0, dtype=np.int64)
+            existing = np.concatenate(seqs) if seqs else np.empty(0)
+            return np.flatnonzero(
+                ~np.isin(self.meta["seq"], existing)
+            ).astype(np.int64)
+
+        deleted = await asyncio.to_thread(find_deleted)
+        if len(deleted):
+            tmp_file = self.path / "deleted.tmp.npy"
+            np.save(tmp_file, deleted)
+            os.replace(tmp_file, self._deleted_file)
+        self.state["deleted"] = len(deleted)
+        self.state["reconciled_at"] = time.time()
+        self._write_state()
+        logging.info("Masked %d deleted vectors", len(deleted))
+
+    async def _fetch(self, session: AsyncSession, after_seq: int):
+        res = await session.execute(
+            select(
+                EmbeddingModel.seq,
+                EmbeddingModel.embedding,
+                ArticleModel.id,
+                ArticleModel.type,
+                ArticleModel.classification_slug,
+                ArticleModel.publication_id,
+                ArticleModel.effective_at,
+            )
+            .join(
+                ArticleModel,
+                ArticleModel.id == EmbeddingModel.article_id,
+            )
+            .where(EmbeddingModel.seq > after_seq)
+            .order_by(EmbeddingModel.seq)
+            .limit(settings.vector_engine_refresh_batch)
+        )
+        return res.all()
+
+    def _code(self, kind: str, value: str | None) -> int:
+        if value is None:
+            return -1
+        codes = self.state[kind]
+        return codes.setdefault(value, len(codes))
+
+    def _append(self, rows: list) -> None:
+        vectors = np.array(
+            [row.embedding for row in rows], dtype=np.float32
+        )
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors /= np.where(norms == 0, 1, norms)
+
+        meta = np.empty(len(rows), dtype=META_DTYPE)
+        meta["seq"] = [row.seq for row in rows]
+        meta["article_id"] = [row.id for row in rows]
+        meta["publication_id"] = [
+            -1 if row.publication_id is None else row.publication_id
+            for row in rows
+        ]
+        meta["effective_at"] = [
+            NULL_TIME if row.effective_at is None
+            else _timestamp(row.effective_at)
+            for row in rows
+        ]
+        meta["type"] = [self._code("types", row.type) for row in rows]
+        meta["classification"] = [
+            self._code("classifications", row.classification_slug)
+            for row in rows
+        ]
+
+        dtype = np.dtype(self.state["dtype"])
+        rows_before = self.state["rows"]
+        window_row = self.state.get("window_row", 0)
+        window = meta["seq"]
+        if rows_before > window_row:
+            loaded = np.memmap(
+                self._meta_file,
+                dtype=META_DTYPE,
+                mode="r",
+                shape=(rows_before,),
+            )
+            window = np.concatenate(
+                [loaded["seq"][window_row:], window]
+            )
+
+        # Drop whatever a crashed refresh may have appended past the
+        # last recorded state before writing new rows.
+        for file, data, row_size in (
+            (
+                self._vectors_file,
+                vectors.astype(dtype),
+                dtype.itemsize * DIMENSIONS,
+            ),
+            (self._meta_file, meta, META_DTYPE.itemsize),
+        ):
+            with open(file, "ab") as f:
+                f.truncate(rows_before * row_size)
+                f.write(data.tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+
+        last_seq = max(self.state["last_seq"], int(meta["seq"].max()))
+        # last_seq only grows, rows that fell out of the window stay
+        # out of it.
+        inside = window > last_seq - settings.vector_engine_seq_lag
+        if inside.any():
+            window_row += int(np.argmax(inside))
+        else:
+            window_row += len(window)
+
+        self.state["rows"] = rows_before + len(rows)
+        self.state["last_seq"] = last_seq
+        self.state["window_row"] = window_row
+        self._write_state()
+
+    def _mask(
+        self,
+        meta: np.ndarray,
+        state: dict,
+        type: str | None,
+        classifications: list[str] | None,
+        pub_ids: list[int] | None,
+        start_date: datetime | None,
+        end_date: datetime | None,
+    ) -> np.ndarray | None:
+        if not any(
+            (type, classifications, pub_ids, start_date, end_date)
+        ):
+            return None
+
+        mask = np.ones(len(meta), dtype=bool)
+        if type:
+            mask &= meta["type"] == state["types"].get(type, -2)
+
+        if classifications or pub_ids:
+            sub_mask = np.zeros(len(meta), dtype=bool)
+            if classifications:
+                codes = [
+                    state["classifications"][slug]
+                    for slug in classifications
+                    if slug in state["classifications"]
+                ]
+                sub_mask |= np.isin(meta["classification"], codes)
+            if pub_ids:
+                sub_mask |= np.isin(meta["publication_id"], pub_ids)
+            mask &= sub_mask
+
+        if start_date or end_date:
+            effective_at = meta["effective_at"]
+            mask &= effective_at != NULL_TIME
+            if start_date:
+                mask &= effective_at >= _timestamp(start_date)
+            if end_date:
+                mask &= effective_at <= _timestamp(end_date)
+        return mask
+
+    def nearest_articles(
+        self,
+        embedding: list[float],
+        limit: int,
+        max_distance: float,
+        type: str | None = None,
+        classifications: list[str] | None = None,
+        pub_ids: list[int] | None = None,
+        start_date: datetime | None = None,
+        end_date: datetime | None = None,
+    ) -> list[tuple[int, float]]:
+        vectors, meta, state = self.vectors, self.meta, self.state
+        deleted = self.deleted
+        if vectors is None or meta is None:
+            return []
+
+        query = np.asarray(embedding, dtype=np.float32)
+        query /= np.linalg.norm(query) or 1.0
+
+        scores = np.empty(len(vectors), dtype=np.float32)
+        buffer = None
+        if vectors.dtype != np.float32:
+            buffer = getattr(self._buffers, "block", None)
+            if buffer is None:
+                buffer = np.empty((BLOCK_ROWS, DIMENSIONS), np.float32)
+                self._buffers.block = buffer
+        for start in range(0, len(vectors), BLOCK_ROWS):
+            block = vectors[start : start + BLOCK_ROWS]
+            if buffer is not None:
+                np.copyto(buffer[: len(block)], block)
+                block = buffer[: len(block)]
+            np.matmul(
+                block, query, out=scores[start : start + len(block)]
+            )
+        if deleted is not None:
+            scores[deleted[deleted < len(scores)]] = -np.inf
+
+        mask = self._mask(
+            meta,
+            state,
+            type=type,
+            classifications=classifications,
+            pub_ids=pub_ids,
+            start_date=start_date,
+            end_date=end_date,
+        )
+        if mask is not None:
+            scores[~mask] = -np.inf
+
+        # Top chunks first, then the best chunk per article. The number
+        # of chunks taken doubles until `limit` articles are found or
+        # no chunks above the threshold are left, like rank_semantic.
+        min_similarity = 1 - max_distance
+        k = limit * settings.search_chunk_overfetch
+        while True:
+            k = min(k, len(scores))
+            if k == 0:
+                return []
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top])]
+
+            results: dict[int, float] = {}
+            for index in top:
+                similarity = float(scores[index])
+                if similarity < min_similarity:
+                    break
+                article_id = int(meta["article_id"][index])
+                results.setdefault(article_id, 1 - similarity)
+                if len(results) == limit:
+                    break
+            else:
+                if k < len(scores):
+                    k *= 2
+                    continue
+            break
+        return list(results.items())
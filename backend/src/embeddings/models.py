@@ -1,19 +1,104 @@
+from datetime import datetime
 from uuid import uuid4
 
-from pgvector.sqlalchemy import Vector
-from sqlalchemy import BigInteger, String
+from pgvector.sqlalchemy import BIT, HALFVEC, Vector
+from sqlalchemy import (
+    BigInteger,
+    DateTime,
+    Index,
+    Integer,
+    Sequence,
+    String,
+    cast,
+    func,
+)
 from sqlalchemy.orm import Mapped, mapped_column
 
 from src.core.db.declaration import CustomDeclarativeBase
+from src.core.settings import settings
 
 
 class EmbeddingModel(CustomDeclarativeBase):
     __tablename__ = "embeddings"
+    __table_args__ = (
+        Index(
+            "embeddings_article_id_chunk_index_idx",
+            "article_id",
+            "chunk_index",
+            unique=True,
+        ),
+    )
 
     id: Mapped[str] = mapped_column(
         String(36), primary_key=True, default=lambda _: str(uuid4)
     )
-    article_id: Mapped[int] = mapped_column(BigInteger, nullable=False)
+    article_id: Mapped[int] = mapped_column(
+        BigInteger, nullable=False, index=True
+    )
+    # Position of the chunk within its article, unique together with
+    # article_id so retried inserts do not duplicate rows.
+    chunk_index: Mapped[int | None] = mapped_column(Integer)
+    embedding: Mapped[list[float]] = mapped_column(
+        Vector(dim=1536), nullable=False
+    )
+    # Insertion order, used by the in-memory vector engine to pick up
+    # new rows incrementally.
+    seq: Mapped[int] = mapped_column(
+        BigInteger,
+        Sequence("embeddings_seq_seq"),
+        nullable=False,
+        index=True,
+    )
+    # sha256 of the embedding model and the normalized chunk text,
+    # identical chunks reuse the stored vector instead of the API.
+    content_hash: Mapped[str | None] = mapped_column(
+        String(64), index=True
+    )
+
+
+def _vector_index() -> Index:
+    # Only the ANN index of DEADLOCK_VECTOR_QUANTIZATION exists, its
+    # expression must match vectors.index_distance.
+    embedding = EmbeddingModel.embedding
+    if settings.vector_quantization == "halfvec":
+        return Index(
+            "embeddings_embedding_halfvec_idx",
+            cast(embedding, HALFVEC(1536)).label("halfvec"),
+            postgresql_using="hnsw",
+            postgresql_ops={"halfvec": "halfvec_cosine_ops"},
+        )
+    if settings.vector_quantization == "binary":
+        return Index(
+            "embeddings_embedding_bit_idx",
+            cast(func.binary_quantize(embedding), BIT(1536)).label(
+                "bit"
+            ),
+            postgresql_using="hnsw",
+            postgresql_ops={"bit": "bit_hamming_ops"},
+        )
+    return Index(
+        "embeddings_embedding_hnsw_idx",
+        embedding,
+        postgresql_using="hnsw",
+        postgresql_with={"m": 16, "ef_construction": 64},
+        postgresql_ops={"embedding": "vector_cosine_ops"},
+    )
+
+
+vector_index = _vector_index()
+
+
+class QueryCacheModel(CustomDeclarativeBase):
+    __tablename__ = "query_cache"
+    __table_args__ = {"prefixes": ["UNLOGGED"]}
+
+    key: Mapped[str] = mapped_column(String(64), primary_key=True)
+    query: Mapped[str] = mapped_column(String, nullable=False)
     embedding: Mapped[list[float]] = mapped_column(
         Vector(dim=1536), nullable=False
     )
+    created_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True),
+        server_default=func.now(),
+        nullable=False,
+    )
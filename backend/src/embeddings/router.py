@@ -1,10 +1,18 @@
 from fastapi import APIRouter, Depends
 
-from src.articles.crud import ArticlesCRUD, get_articles_crud
-from src.embeddings.crud import EmbeddingsCRUD, get_embeddings_crud
+from src.core.cache import TTLCache
+from src.core.settings import settings
+from src.embeddings.crud import (
+    EmbeddingsCRUD,
+    get_embeddings_crud,
+    query_cache,
+)
 
 router = APIRouter(prefix="/embeddings", tags=["embeddings"])
 
+stats_cache = TTLCache(ttl=settings.stats_cache_ttl)
+backlog_cache = TTLCache(ttl=settings.stats_backlog_ttl)
+
 
 @router.get("/generate")
 async def generate_embeddings(
@@ -13,36 +21,47 @@ async def generate_embeddings(
 ):
     if limit <= 0:
         return {"message": "Limit cannot be 0."}
-    (
-        article_ids,
-        article_texts,
-    ) = await embeddings_crud.get_unprocessed_articles(limit=limit)
 
-    text_embeddings = embeddings_crud.generate_embeddings_batch(
-        data=article_texts
-    )
-    if not article_ids:
+    chunks = await embeddings_crud.get_unprocessed_articles(limit=limit)
+    if not chunks:
         return {"message": "No new articles to process."}
-    await embeddings_crud.insert_embeddings_batch(
-        article_ids, text_embeddings
-    )
+
+    report = await embeddings_crud.embed_chunks(chunks)
     return {
         "message": f"""Embeddings generated successfully
-            for {len(article_ids)} articles."""
+            for {len(chunks)} articles.""",
+        "chunks": report.chunks,
+        "embedded": report.embedded,
+        "reused": report.reused,
     }
 
 
 @router.get("/stats")
 async def get_stats(
+    exact: bool = False,
     embeddings_crud: EmbeddingsCRUD = Depends(get_embeddings_crud),
-    articles_crud: ArticlesCRUD = Depends(get_articles_crud),
 ):
-    embeddings_count = await embeddings_crud.get_embeddings_count()
-    articles_count = await articles_crud.get_articles_count()
-    missing_embeddings = articles_count - embeddings_count
+    if not exact and (stats := stats_cache.get("embeddings")):
+        return stats
 
-    return {
+    embeddings_count = await embeddings_crud.get_embeddings_count(
+        exact=exact
+    )
+
+    backlog = None if exact else backlog_cache.get("backlog")
+    if backlog is None:
+        backlog = await embeddings_crud.get_backlog_by_age()
+        backlog_cache.set("backlog", backlog)
+
+    stats = {
         "count": embeddings_count,
-        "missing": missing_embeddings,
+        "missing": sum(backlog.values()),
+        "backlog": backlog,
     }
+    stats_cache.set("embeddings", stats)
+    return stats
+
 
+@router.get("/cache")
+async def get_cache_stats():
+    return query_cache.stats()
@@ -0,0 +1,138 @@
+from pgvector.sqlalchemy import BIT, HALFVEC, Vector
+from sqlalchemy import (
+    ColumnElement,
+    Select,
+    cast,
+    func,
+    literal,
+    select,
+)
+
+from src.core.settings import settings
+from src.embeddings.models import EmbeddingModel
+
+DIMENSIONS = 1536
+
+
+def _query_vector(
+    embedding: list[float] | ColumnElement,
+) -> ColumnElement:
+    if not isinstance(embedding, ColumnElement):
+        embedding = literal(embedding, Vector(DIMENSIONS))
+    return cast(embedding, Vector(DIMENSIONS))
+
+
+def index_distance(
+    embedding: list[float] | ColumnElement,
+) -> ColumnElement:
+    # These expressions must match the indexed expressions exactly,
+    # otherwise the planner falls back to a sequential scan.
+    query_vector = _query_vector(embedding)
+    if settings.vector_quantization == "halfvec":
+        return cast(
+            EmbeddingModel.embedding, HALFVEC(DIMENSIONS)
+        ).cosine_distance(cast(query_vector, HALFVEC(DIMENSIONS)))
+    if settings.vector_quantization == "binary":
+        return cast(
+            func.binary_quantize(EmbeddingModel.embedding),
+            BIT(DIMENSIONS),
+        ).hamming_distance(func.binary_quantize(query_vector))
+    return EmbeddingModel.embedding.cosine_distance(embedding)
+
+
+# Adds the nearest-neighbour search to a query over embeddings. The
+# result has the columns of `query` plus the exact cosine `distance` and
+# is ordered by it. With a quantized index, the index only preselects
+# `vector_rerank_factor` times more candidates, which are then re-ranked
+# on the full vectors.
+def nearest(
+    query: Select,
+    embedding: list[float] | ColumnElement,
+    limit: int,
+    max_distance: float,
+) -> Select:
+    if settings.vector_quantization not in ("halfvec", "binary"):
+        # The distance filter stays outside the index scan. Inside it,
+        # an iterative scan with fewer than `limit` close rows would
+        # walk up to hnsw.max_scan_tuples looking for more.
+        distance = EmbeddingModel.embedding.cosine_distance(embedding)
+        candidates = (
+            query.add_columns(distance.label("distance"))
+            .order_by(distance)
+            .limit(limit)
+            .cte("nearest_candidates")
+            .prefix_with("MATERIALIZED")
+        )
+        return (
+            select(candidates)
+            .where(candidates.c.distance <= max_distance)
+            .order_by(candidates.c.distance)
+        )
+
+    candidates = (
+        query.add_columns(
+            EmbeddingModel.embedding.label("exact_embedding")
+        )
+        .order_by(index_distance(embedding))
+        .limit(limit * settings.vector_rerank_factor)
+        .subquery("quantized_candidates")
+    )
+    distance = candidates.c.exact_embedding.cosine_distance(
+        _query_vector(embedding)
+    )
+    return (
+        select(
+            *[
+                column
+                for column in candidates.c
+                if column.name != "exact_embedding"
+            ],
+            distance.label("distance"),
+        )
+        .where(distance <= max_distance)
+        .order_by(distance)
+        .limit(limit)
+    )
+
+
+# Article level variant of `nearest`: chunks of one article share its
+# article_id, so the best chunk per article is kept. The chunks are
+# over-fetched `overfetch` times `limit`, which can still yield fewer
+# than `limit` articles. The `chunks` column counts the candidates that
+# passed the threshold, when it reaches `limit * overfetch` more may
+# exist and the caller retries with a larger over-fetch.
+# `query` must select EmbeddingModel.article_id.
+def nearest_articles(
+    query: Select,
+    embedding: list[float] | ColumnElement,
+    limit: int,
+    max_distance: float,
+    overfetch: int | None = None,
+) -> Select:
+    # Relaxed-order iterative scans may return chunks slightly out of
+    # order, so the over-fetched candidates are materialized and ranked
+    # again after grouping.
+    overfetch = overfetch or settings.search_chunk_overfetch
+    candidates = (
+        nearest(
+            query,
+            embedding,
+            limit=limit * overfetch,
+            max_distance=max_distance,
+        )
+        .cte("chunk_candidates")
+        .prefix_with("MATERIALIZED")
+    )
+    distance = func.min(candidates.c.distance).label("distance")
+    chunks = (
+        select(func.count())
+        .select_from(candidates)
+        .scalar_subquery()
+        .label("chunks")
+    )
+    return (
+        select(candidates.c.article_id, distance, chunks)
+        .group_by(candidates.c.article_id)
+        .order_by(distance)
+        .limit(limit)
+    )
@@ -0,0 +1,221 @@
+import asyncio
+import functools
+import logging
+import random
+import time
+from itertools import groupby
+
+import openai
+import tiktoken
+from openai import AsyncOpenAI
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from src.articles.crud import ArticlesCRUD
+from src.core.lifetime import (
+    create_db_engine,
+    create_encoding,
+    create_openai_client,
+)
+from src.core.settings import settings
+from src.embeddings.crud import Chunk, EmbeddingsCRUD
+
+RETRYABLE_ERRORS = (
+    openai.RateLimitError,
+    openai.APIConnectionError,
+    openai.APITimeoutError,
+    openai.InternalServerError,
+)
+
+
+def pack_articles(chunks: list[Chunk]) -> list[list[Chunk]]:
+    # Chunks of one article always travel in the same batch, so a batch
+    # commit never leaves an article half embedded.
+    batches: list[list[Chunk]] = []
+    batch: list[Chunk] = []
+    batch_tokens = 0
+    max_tokens = settings.embedding_batch_tokens
+    max_inputs = settings.embedding_batch_inputs
+    for _, group in groupby(chunks, key=lambda chunk: chunk.article_id):
+        article_chunks = list(group)
+        article_tokens = sum(chunk.tokens for chunk in article_chunks)
+        if batch and (
+            batch_tokens + article_tokens > max_tokens
+            or len(batch) + len(article_chunks) > max_inputs
+        ):
+            batches.append(batch)
+            batch, batch_tokens = [], 0
+        batch.extend(article_chunks)
+        batch_tokens += article_tokens
+
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+class EmbeddingWorker:
+    def __init__(
+        self,
+        session_factory: async_sessionmaker[AsyncSession],
+        client: AsyncOpenAI,
+        encoding: tiktoken.Encoding,
+    ):
+        self.session_factory = session_factory
+        self.client = client
+        self.encoding = encoding
+        self.slots = asyncio.Semaphore(
+            settings.embedding_worker_concurrency
+        )
+        self.in_flight: set[asyncio.Task] = set()
+        # Article id to (failed attempts, monotonic time of the next
+        # attempt), failed articles are skipped until then.
+        self.failures: dict[int, tuple[int, float]] = {}
+        self.embedded = 0
+        self.reused = 0
+        self.purged_at = 0.0
+
+    def _crud(self, session: AsyncSession) -> EmbeddingsCRUD:
+        return EmbeddingsCRUD(
+            session, client=self.client, encoding=self.encoding
+        )
+
+    async def run(self) -> None:
+        after_id = 0
+        while True:
+            async with self.session_factory() as session:
+                crud = self._crud(session)
+                articles = await crud.fetch_unprocessed_articles(
+                    limit=settings.embedding_worker_fetch_size,
+                    after_id=after_id,
+                    exclude_ids=self._backed_off_ids(),
+                )
+
+            if not articles:
+                # End of this pass over the backlog. Wait for in-flight
+                # batches so the next pass does not pick them up again.
+                await self._drain()
+                await self._purge_caches()
+                if after_id == 0:
+                    await asyncio.sleep(
+                        settings.embedding_worker_idle_seconds
+                    )
+                after_id = 0
+                continue
+
+            after_id = articles[-1].id
+            chunks = await crud.chunk_articles(articles)
+
+            for batch in pack_articles(chunks):
+                await self.slots.acquire()
+                task = asyncio.create_task(self._process(batch))
+                self.in_flight.add(task)
+                task.add_done_callback(self.in_flight.discard)
+
+    def _backed_off_ids(self) -> set[int]:
+        now = time.monotonic()
+        return {
+            article_id
+            for article_id, (_, retry_at) in self.failures.items()
+            if retry_at > now
+        }
+
+    def _record_failure(self, article_ids: set[int]) -> None:
+        now = time.monotonic()
+        for article_id in article_ids:
+            attempts = self.failures.get(article_id, (0, 0.0))[0] + 1
+            delay = min(
+                settings.embedding_worker_max_retry_seconds,
+                settings.embedding_worker_retry_seconds
+                * 2 ** (attempts - 1),
+            )
+            self.failures[article_id] = (attempts, now + delay)
+
+    async def _drain(self) -> None:
+        if self.in_flight:
+            await asyncio.gather(*self.in_flight)
+
+    async def _purge_caches(self) -> None:
+        # Reads already skip expired rows of the shared query and search
+        # result caches, this keeps the unlogged tables from growing
+        # without bound.
+        now = time.monotonic()
+        if now - self.purged_at < settings.query_cache_purge_seconds:
+            return
+        self.purged_at = now
+        try:
+            async with self.session_factory() as session:
+                queries = await self._crud(session).purge_query_cache()
+                results = await ArticlesCRUD(
+                    session
+                ).purge_search_results()
+            logging.info(
+                "Purged %d expired cached queries and %d result sets",
+                queries,
+                results,
+            )
+        except Exception as e:
+            logging.warning(f"Cache purge failed: {e}")
+
+    async def _process(self, batch: list[Chunk]) -> None:
+        article_ids = {chunk.article_id for chunk in batch}
+        try:
+            async with self.session_factory() as session:
+                crud = self._crud(session)
+                embed = functools.partial(self._embed_with_retry, crud)
+                report = await crud.embed_chunks(batch, embed=embed)
+            self.embedded += report.embedded
+            self.reused += report.reused
+            for article_id in article_ids:
+                self.failures.pop(article_id, None)
+            logging.info(
+                "Embedded %d chunks of %d articles, %d reused by "
+                "content hash (%d sent, %d saved in total)",
+                len(batch),
+                len(article_ids),
+                report.reused,
+                self.embedded,
+                self.reused,
+            )
+        except Exception as e:
+            logging.warning(e)
+            self._record_failure(article_ids)
+        finally:
+            self.slots.release()
+
+    async def _embed_with_retry(
+        self, crud: EmbeddingsCRUD, chunks: list[Chunk]
+    ) -> list[list[float]]:
+        max_attempts = settings.embedding_worker_max_attempts
+        for attempt in range(max_attempts):
+            try:
+                return await crud.generate_embeddings_batch(
+                    data=[chunk.text for chunk in chunks]
+                )
+            except RETRYABLE_ERRORS as e:
+                if attempt + 1 == max_attempts:
+                    raise
+                delay = min(60.0, 2.0**attempt)
+                delay *= random.uniform(0.5, 1.5)
+                logging.warning(
+                    "Embedding request failed (%s), retrying in %.1fs",
+                    e,
+                    delay,
+                )
+                await asyncio.sleep(delay)
+        return []
+
+
+async def run_embedding_worker() -> None:
+    engine = create_db_engine()
+    # _embed_with_retry backs off on its own, client retries would
+    # multiply its attempts.
+    client = create_openai_client(max_retries=0)
+    worker = EmbeddingWorker(
+        async_sessionmaker(engine, expire_on_commit=False),
+        client=client,
+        encoding=create_encoding(),
+    )
+    try:
+        await worker.run()
+    finally:
+        await client.close()
+        await engine.dispose()